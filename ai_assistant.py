@@ -1,10 +1,29 @@
-from worker import AIWorker
+from worker import AIRequest
+from scheduler import RequestScheduler
+from cancellation import CANCELLED
+from metrics import format_timings
+from PyQt6.QtGui import QTextCharFormat, QTextCursor
 import uuid
+import weakref
 
 class AIAssistantHandler:
     def __init__(self, ide):
         self.ide = ide
-        self.session_id = str(uuid.uuid4()) 
+        # Requests made with no editor tab open share this session.
+        self.session_id = str(uuid.uuid4())
+        self.tab_sessions = weakref.WeakKeyDictionary()
+        self.scheduler = RequestScheduler()
+        # Each request streams into its own place in the panel, so concurrent
+        # requests from different tabs don't interleave their text.
+        self.cursors = {}
+
+    def session_for(self, editor):
+        if editor is None:
+            return self.session_id
+        session_id = self.tab_sessions.get(editor)
+        if session_id is None:
+            session_id = self.tab_sessions[editor] = str(uuid.uuid4())
+        return session_id
 
     def assist_code(self):
         editor = self.ide.get_current_editor()
@@ -19,7 +38,7 @@ class AIAssistantHandler:
         else:
             code = ""
 
-        prompt = self.ide.promptInput.toPlainText() 
+        prompt = self.ide.promptInput.toPlainText()
         if not prompt.strip():
             self.ide.promptInput.setText("💡 AI Code Assistant: Please write a prompt!")
             return
@@ -29,19 +48,68 @@ class AIAssistantHandler:
         user_query = self.ide.promptInput.toPlainText().strip()
         self.ide.aiPanel.append(f'<div style="color: blue;"><b>You:</b> {user_query}</div>')
         self.ide.aiPanel.append('<div style="color: gray;"><b>AI:</b> ⏳ Processing...</div>')
+        # An empty block for the response, then a spacer that later messages are appended after.
+        self.ide.aiPanel.append("")
+        self.ide.aiPanel.append("")
+        cursor = QTextCursor(self.ide.aiPanel.document().lastBlock().previous())
+        cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock)
 
-        self.worker = AIWorker(self.ide.code_buddy, language, code, prompt, assistant, self.session_id)
-        self.worker.result_signal.connect(self.update_ai_response)
-        self.worker.error_signal.connect(self.update_ai_error)
-        self.worker.start()
+        request = AIRequest(self.ide.assistant_backend, language, code, prompt, assistant, self.session_for(editor))
+        self.cursors[request] = cursor
+        request.result_signal.connect(lambda response, r=request: self.update_ai_response(r, response))
+        request.finished_signal.connect(lambda meta, r=request: self.finish_ai_response(r, meta))
+        request.error_signal.connect(lambda message, r=request: self.update_ai_error(r, message))
+        request.superseded_signal.connect(lambda r=request: self.supersede_ai_response(r))
+        request.submit(self.scheduler)
 
-    def update_ai_response(self, response):
-        current_text = self.ide.aiPanel.toPlainText()
-        formatted_response = "\n".join(response.splitlines())  
-        if current_text == "⏳ AI Code Assistant is processing...":
-            self.ide.aiPanel.setText(f"💡 AI Code Assistant:\n\n{formatted_response}")
-        else:
-            self.ide.aiPanel.setText(current_text + "\n" + formatted_response) 
+    def update_ai_response(self, request, response):
+        cursor = self.cursors.get(request)
+        if cursor is None:
+            return
+        cursor.insertText(response, QTextCharFormat())
+        self.ide.aiPanel.ensureCursorVisible()
+
+    def stop(self):
+        """Stops the current tab's requests, running or queued."""
+        session_id = self.session_for(self.ide.get_current_editor())
+        for request in list(self.cursors):
+            if request.session_id == session_id and request.job is not None:
+                self.scheduler.cancel(request.job)
+
+    def finish_ai_response(self, request, meta):
+        cursor = self.cursors.pop(request, None)
+        if meta.get('cancelled'):
+            stopped = meta['cancelled'] == CANCELLED
+            if cursor is not None:
+                note = "⏹ Stopped" if stopped else "⏱ Timed out"
+                cursor.insertHtml(f'<br><span style="color: gray;"><i>{note}</i></span>')
+            status = "Request stopped" if stopped else "Request timed out"
+            if 'total_time' in meta:
+                status += f" after {meta['total_time']:.2f}s"
+            self.ide.statusBar().showMessage(status)
+        elif meta.get('cached') and cursor is not None:
+            cursor.insertHtml('<br><span style="color: gray;"><i>⚡ Served from cache</i></span>')
+            self.ide.statusBar().showMessage(
+                f"Answer served from the {meta['cached']} response cache in {meta['total_time']:.2f}s"
+            )
+        elif 'time_to_first_token' in meta:
+            status = (f"First token after {meta['time_to_first_token']:.2f}s, "
+                      f"response complete in {meta['total_time']:.2f}s")
+            if meta.get('timings'):
+                status += f" ({format_timings(meta['timings'])})"
+            if meta.get('overlap_saved'):
+                status += f"; concurrent context lookup saved {meta['overlap_saved']:.2f}s"
+            self.ide.statusBar().showMessage(status)
+
+    def update_ai_error(self, request, error_message):
+        cursor = self.cursors.pop(request, None)
+        if cursor is not None:
+            cursor.insertHtml(f'<span style="color: red;"><b>Error:</b> {error_message}</span>')
+
+    def supersede_ai_response(self, request):
+        cursor = self.cursors.pop(request, None)
+        if cursor is not None:
+            cursor.insertHtml('<span style="color: gray;"><i>Skipped: superseded by a newer request from this tab.</i></span>')
 
-    def update_ai_error(self, error_message):
-        self.ide.aiPanel.append(f'<div style="color: red;"><b>Error:</b> {error_message}</div>')
\ No newline at end of file
+    def close(self):
+        self.scheduler.close(wait=False)
@@ -0,0 +1,225 @@
+import os
+import argparse
+import sqlite3
+import numpy as np
+from vector_store import normalize_rows, open_store
+
+DEFAULT_NPROBE = 8
+# build_sidecar picks the smallest nprobe whose recall@CALIBRATION_TOP_K against an
+# exact scan reaches this (see IVFIndex.calibrate).
+DEFAULT_TARGET_RECALL = 0.95
+CALIBRATION_QUERIES = 100
+CALIBRATION_TOP_K = 3
+KMEANS_ITERATIONS = 10
+TRAIN_POINTS_PER_LIST = 256
+ASSIGN_BATCH = 65536
+
+
+def sidecar_path(db_path):
+    return os.path.splitext(db_path)[0] + ".ivf.npz"
+
+
+def default_nlist(n_rows):
+    return max(1, min(n_rows, int(4 * np.sqrt(n_rows))))
+
+
+class IVFIndex:
+    """Inverted-file index: vectors are bucketed by their nearest centroid and a
+    query only scores the rows in its `nprobe` closest buckets. `recall` is the
+    recall measured when `nprobe` was calibrated, or None."""
+
+    def __init__(self, centroids, list_ids, rowids, nprobe=DEFAULT_NPROBE, recall=None):
+        self.centroids = centroids
+        self.nprobe = nprobe
+        self.recall = recall
+        self._set_lists(list_ids, rowids)
+
+    def _set_lists(self, list_ids, rowids):
+        order = np.argsort(list_ids, kind="stable")
+        self.list_ids = list_ids[order]
+        self.rowids = rowids[order]
+        counts = np.bincount(self.list_ids, minlength=len(self.centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+        self.max_rowid = int(self.rowids.max()) if len(self.rowids) else 0
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.rowids)
+
+    def assign(self, matrix):
+        list_ids = np.empty(len(matrix), dtype=np.int32)
+        for start in range(0, len(matrix), ASSIGN_BATCH):
+            batch = matrix[start:start + ASSIGN_BATCH]
+            list_ids[start:start + len(batch)] = np.argmax(batch @ self.centroids.T, axis=1)
+        return list_ids
+
+    @classmethod
+    def train(cls, matrix, rowids, nlist=None, iterations=KMEANS_ITERATIONS, seed=0, nprobe=DEFAULT_NPROBE):
+        rng = np.random.default_rng(seed)
+        nlist = min(nlist or default_nlist(len(matrix)), len(matrix))
+
+        sample_size = min(len(matrix), nlist * TRAIN_POINTS_PER_LIST)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        # Spherical k-means: the index scores by cosine, so centroids stay unit length.
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        index = cls(centroids, np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64), nprobe)
+        index.add(matrix, rowids)
+        return index
+
+    def add(self, matrix, rowids):
+        if not len(rowids):
+            return
+        self._set_lists(
+            np.concatenate((self.list_ids, self.assign(matrix))),
+            np.concatenate((self.rowids, np.asarray(rowids, dtype=np.int64)))
+        )
+
+    def remove(self, rowids):
+        keep = ~np.isin(self.rowids, np.asarray(rowids, dtype=np.int64))
+        self._set_lists(self.list_ids[keep], self.rowids[keep])
+
+    def candidates(self, query, nprobe=None):
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        return np.concatenate(
+            [self.rowids[self.offsets[i]:self.offsets[i + 1]] for i in probed]
+        )
+
+    def calibrate(self, matrix, rowids, target_recall=DEFAULT_TARGET_RECALL, queries=None,
+                  top_k=CALIBRATION_TOP_K, seed=0):
+        """Sets `nprobe` to the smallest power-of-two multiple of DEFAULT_NPROBE whose
+        recall@top_k against an exact scan reaches `target_recall` on `queries`, or
+        to `nlist` if none does. Returns the recall reached.
+
+        Without `queries`, CALIBRATION_QUERIES sampled rows stand in for them, each
+        excluded from its own results. Queries worded unlike the corpus land
+        further from the centroids and get lower recall, so pass real query
+        embeddings when there are some."""
+        rowids = np.asarray(rowids, dtype=np.int64)
+        if len(rowids) <= top_k:
+            self.nprobe, self.recall = self.nlist, 1.0
+            return self.recall
+
+        if queries is None:
+            rng = np.random.default_rng(seed)
+            own_rows = rng.choice(len(rowids), min(CALIBRATION_QUERIES, len(rowids)), replace=False)
+            queries = matrix[own_rows]
+        else:
+            queries = normalize_rows(np.asarray(queries, dtype=np.float32))
+            own_rows = np.full(len(queries), -1)
+        excluded = [rowids[row] if row >= 0 else None for row in own_rows]
+
+        truth = []
+        for query, row in zip(queries, own_rows):
+            scores = matrix @ query
+            if row >= 0:
+                scores[row] = -np.inf
+            truth.append(set(rowids[np.argpartition(-scores, top_k - 1)[:top_k]].tolist()))
+
+        nprobe = min(DEFAULT_NPROBE, self.nlist)
+        while True:
+            found = 0
+            for query, own_rowid, expected in zip(queries, excluded, truth):
+                candidates = self.candidates(query, nprobe)
+                candidates = candidates[candidates != own_rowid]
+                if not len(candidates):
+                    continue
+                scores = matrix[np.searchsorted(rowids, candidates)] @ query
+                top = candidates[np.argpartition(-scores, min(top_k, len(scores)) - 1)[:top_k]]
+                found += len(expected.intersection(top.tolist()))
+            recall = found / (top_k * len(queries))
+            if recall >= target_recall or nprobe >= self.nlist:
+                break
+            nprobe = min(nprobe * 2, self.nlist)
+
+        self.nprobe, self.recall = nprobe, recall
+        return recall
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        extra = {} if self.recall is None else {"recall": self.recall}
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, list_ids=self.list_ids, rowids=self.rowids,
+                     nprobe=self.nprobe, **extra)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        """`nprobe` overrides the calibrated value; sidecars written before
+        calibration existed fall back to DEFAULT_NPROBE."""
+        with np.load(path) as data:
+            if nprobe is None:
+                nprobe = int(data["nprobe"]) if "nprobe" in data.files else DEFAULT_NPROBE
+            recall = float(data["recall"]) if "recall" in data.files else None
+            return cls(data["centroids"], data["list_ids"], data["rowids"], nprobe, recall)
+
+
+def read_vectors(db_path, min_rowid=0):
+    conn = sqlite3.connect(db_path)
+    try:
+        return open_store(conn, db_path).read_vectors(conn, min_rowid)
+    finally:
+        conn.close()
+
+
+def build_sidecar(db_path, nlist=None, iterations=KMEANS_ITERATIONS, target_recall=DEFAULT_TARGET_RECALL,
+                  queries=None):
+    """Trains the sidecar and calibrates its default nprobe, on `queries` (query
+    embeddings) if given."""
+    rowids, matrix = read_vectors(db_path)
+    if not len(rowids):
+        return None
+
+    index = IVFIndex.train(matrix, rowids, nlist=nlist, iterations=iterations)
+    index.calibrate(matrix, rowids, target_recall, queries)
+    index.save(sidecar_path(db_path))
+    return index
+
+
+def update_sidecar(db_path, removed_rowids=()):
+    """Folds rows added since the last build into an existing sidecar. Does nothing
+    when no sidecar has been built for this database."""
+    path = sidecar_path(db_path)
+    if not os.path.exists(path):
+        return None
+
+    index = IVFIndex.load(path)
+    if len(removed_rowids):
+        index.remove(removed_rowids)
+
+    rowids, matrix = read_vectors(db_path, index.max_rowid)
+    index.add(matrix, rowids)
+    index.save(path)
+    return index
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the IVF sidecar index for an embeddings database.")
+    parser.add_argument("--db", default="embeddings.db")
+    parser.add_argument("--nlist", type=int, default=None, help="number of inverted lists (default 4*sqrt(n))")
+    parser.add_argument("--iterations", type=int, default=KMEANS_ITERATIONS)
+    parser.add_argument("--target-recall", type=float, default=DEFAULT_TARGET_RECALL,
+                        help=f"recall@{CALIBRATION_TOP_K} the default nprobe must reach")
+    args = parser.parse_args()
+
+    index = build_sidecar(args.db, nlist=args.nlist, iterations=args.iterations, target_recall=args.target_recall)
+    if index is None:
+        print(f"No embeddings found in '{args.db}'.")
+    else:
+        print(f"Built {sidecar_path(args.db)}: {len(index)} vectors in {index.nlist} lists, "
+              f"nprobe {index.nprobe} (recall@{CALIBRATION_TOP_K} {index.recall:.2f}).")
+        if index.nprobe >= index.nlist:
+            print("⚠️ The target recall needs every list probed; searches will scan exactly.")
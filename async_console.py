@@ -0,0 +1,219 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from embedding_model import DEFAULT_MODEL_NAME, registry, embed_query
+from llm_client import GenerationCancelled
+from cancellation import CLOSED
+from metrics import metrics
+
+# Threads for the blocking stages (SQLite, embedding, retrieval) and for the
+# token streams being relayed to the event loop.
+DEFAULT_STAGE_WORKERS = 8
+
+_STREAM_END = object()
+
+
+class AsyncCodeBuddyConsole:
+    """asyncio front end to a CodeBuddyConsole.
+
+    History lookup, query embedding and retrieval run concurrently instead of one
+    after another. Hybrid retrieval starts its BM25 pass straight away and only
+    waits for the embedding when it reaches the dense pass. Caches, clients and
+    the conversation store are the wrapped console's, so both front ends can be
+    used side by side."""
+
+    def __init__(self, console, max_workers=DEFAULT_STAGE_WORKERS):
+        self.console = console
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="codebuddy-stage")
+
+    def _timed(self, timings, stage, fn, *args):
+        started_at = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            timings[stage] = time.perf_counter() - started_at
+
+    def _retrieve(self, query, embedding_future, timings):
+        waited = []
+
+        def embed(text):
+            if text != query:
+                return embed_query(text)
+            started_at = time.perf_counter()
+            embedding = embedding_future.result()
+            waited.append(time.perf_counter() - started_at)
+            return embedding
+
+        results = self._timed(timings, 'retrieval', self.console.retrieve_relevant_docs, query, 3,
+                              DEFAULT_MODEL_NAME, None, embed)
+        # Time spent blocked on the embedding belongs to the embedding stage.
+        timings['retrieval'] -= sum(waited)
+        return results, bool(waited)
+
+    async def process_query_stream(self, language, code, query, scenario, session_id, meta=None, cancel=None):
+        """Async generator counterpart of CodeBuddyConsole.process_query_stream.
+
+        meta['timings'] has the same stages as the sync version, but history,
+        embedding and retrieval overlap, so they add up to more than the wall time;
+        meta['overlap_saved'] estimates how much running them concurrently saved
+        over running them in sequence."""
+        console = self.console
+        loop = asyncio.get_running_loop()
+        started_at = time.perf_counter()
+        meta = meta if meta is not None else {}
+        timings = meta.setdefault('timings', {})
+        console.validate_scenario(scenario)
+        was_loaded = registry.is_loaded()
+
+        cache_key = console.response_cache.key(scenario, language, code, query, console.llm_client.model)
+        semantic = console.response_cache.semantic_threshold is not None
+        # With the semantic tier on, a miss here is followed by the full lookup below.
+        cached = console.response_cache.get(cache_key, count_miss=not semantic)
+
+        query_embedding = None
+        if cached is None:
+            cancel = console.start_cancel_token(scenario, cancel)
+            embedding_future = self._executor.submit(self._timed, timings, 'embedding', embed_query, query)
+            history_future = self._executor.submit(
+                self._timed, timings, 'history', console.history_manager.context, session_id
+            )
+            retrieval_future = self._executor.submit(self._retrieve, query, embedding_future, timings)
+            if semantic:
+                query_embedding = await asyncio.wrap_future(embedding_future)
+                cached = console.response_cache.get(cache_key, query_embedding)
+
+        if cached is not None:
+            response, tier = cached
+            meta['cached'] = tier
+            meta['time_to_first_token'] = time.perf_counter() - started_at
+            yield response
+            console.conversation_store.queue_turn(session_id, query, response)
+            console.note_model_load(timings, was_loaded)
+            metrics.record("assist", timings, "cached", time.perf_counter() - started_at)
+            meta['total_time'] = time.perf_counter() - started_at
+            if cancel is not None:
+                cancel.close()
+            return
+
+        response_parts = []
+        cancelled = None
+        outcome = "error"
+        try:
+            (history, summary), (relevant_docs, embedding_used) = await asyncio.gather(
+                asyncio.wrap_future(history_future), asyncio.wrap_future(retrieval_future)
+            )
+            context_time = time.perf_counter() - started_at
+            sequential = timings['history'] + timings['retrieval']
+            if semantic or embedding_used:
+                console.note_model_load(timings, was_loaded)
+                sequential += timings.get('embedding', 0.0) + timings.get('model_load', 0.0)
+            meta['overlap_saved'] = max(sequential - context_time, 0.0)
+
+            prompt = self._timed(
+                timings, 'prompt', console.build_prompt,
+                language, code, query, scenario, history, summary, relevant_docs
+            )
+
+            requested_at = first_token_at = time.perf_counter()
+            try:
+                async for token in self._stream_tokens(loop, prompt, cancel):
+                    if not response_parts:
+                        first_token_at = time.perf_counter()
+                        timings['first_token'] = first_token_at - requested_at
+                        meta['time_to_first_token'] = first_token_at - started_at
+                    response_parts.append(token)
+                    yield token
+            except GenerationCancelled as e:
+                cancelled = e.reason
+                meta['cancelled'] = cancelled
+            timings['generation'] = time.perf_counter() - first_token_at
+            outcome = cancelled or "ok"
+        except GeneratorExit:
+            # The caller stopped reading; what it already showed still belongs in the history.
+            outcome = CLOSED
+            console.record_response(session_id, query, "".join(response_parts), cache_key, query_embedding, CLOSED)
+            raise
+        finally:
+            cancel.close()
+            metrics.record("assist", timings, outcome, time.perf_counter() - started_at)
+        console.record_response(session_id, query, "".join(response_parts), cache_key, query_embedding, cancelled)
+        meta['total_time'] = time.perf_counter() - started_at
+
+    async def _stream_tokens(self, loop, prompt, cancel):
+        """Relays the blocking token stream from a worker thread to the event loop.
+        If the consumer stops early, the token is cancelled, aborting the request."""
+        tokens = asyncio.Queue()
+
+        def produce():
+            try:
+                for token in self.console.llm_client.stream_generate(
+                    prompt, temperature=self.console.current_state['temperature'], cancel=cancel
+                ):
+                    loop.call_soon_threadsafe(tokens.put_nowait, token)
+            except BaseException as e:
+                loop.call_soon_threadsafe(tokens.put_nowait, e)
+            else:
+                loop.call_soon_threadsafe(tokens.put_nowait, _STREAM_END)
+
+        loop.run_in_executor(self._executor, produce)
+        finished = False
+        try:
+            while True:
+                item = await tokens.get()
+                if item is _STREAM_END or isinstance(item, BaseException):
+                    finished = True
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            if not finished:
+                cancel.cancel()
+
+    async def ask(self, language, code, query, scenario, session_id, cancel=None):
+        """Returns (response, meta) for callers that don't need the stream."""
+        meta = {}
+        parts = [token async for token in self.process_query_stream(
+            language, code, query, scenario, session_id, meta, cancel
+        )]
+        return "".join(parts), meta
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+class AsyncConsoleBridge:
+    """Runs an AsyncCodeBuddyConsole on an event loop in a background thread and
+    exposes the same blocking `process_query_stream` as CodeBuddyConsole, so the
+    Qt side (AIRequest on the scheduler's threads) can drive the async pipeline
+    unchanged."""
+
+    def __init__(self, async_console):
+        self.async_console = async_console
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="codebuddy-asyncio", daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        # Everything else (llm_client, caches, close...) comes from the wrapped console.
+        return getattr(self.async_console.console, name)
+
+    def process_query_stream(self, language, code, query, scenario, session_id, meta=None, cancel=None):
+        stream = self.async_console.process_query_stream(
+            language, code, query, scenario, session_id, meta, cancel
+        )
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(stream.__anext__(), self.loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(stream.aclose(), self.loop).result()
+
+    def close(self):
+        self.async_console.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
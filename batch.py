@@ -0,0 +1,134 @@
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Runs a JSONL file of assistant requests through one CodeBuddyConsole, e.g.
+# "Code Commenting" over every file in a repo. Each input line is an object with
+# "scenario", "language", "query" and either "code" or "code_path"; "id" and
+# "session_id" are optional. Items without a session_id get their own session so
+# their answers don't leak into each other's history.
+
+DEFAULT_CONCURRENCY = 4
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values` (0 < p <= 100); None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(p / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def read_requests(path):
+    with (sys.stdin if path == "-" else open(path, encoding="utf-8")) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            item.setdefault("id", line_number)
+            if "code" not in item and "code_path" in item:
+                with open(item["code_path"], encoding="utf-8", errors="replace") as code_file:
+                    item["code"] = code_file.read()
+            yield item
+
+
+def run_item(console, item, batch_id):
+    session_id = item.get("session_id") or f"batch-{batch_id}-{item['id']}"
+    meta = {}
+    started_at = time.perf_counter()
+    result = {"id": item["id"], "scenario": item.get("scenario"), "session_id": session_id}
+    try:
+        result["response"] = "".join(console.process_query_stream(
+            item.get("language", "python"), item.get("code", ""), item.get("query", ""),
+            item.get("scenario", "General Assistant"), session_id, meta=meta
+        ))
+    except Exception as e:
+        result["error"] = str(e)
+    result["latency"] = time.perf_counter() - started_at
+    result["time_to_first_token"] = meta.get("time_to_first_token")
+    if meta.get("cached"):
+        result["cached"] = meta["cached"]
+    if meta.get("cancelled"):
+        result["cancelled"] = meta["cancelled"]
+    return result
+
+
+def run_batch(console, requests, output, concurrency=DEFAULT_CONCURRENCY, progress=None):
+    """Runs every request with up to `concurrency` in flight and writes one JSON
+    result per line to `output` as they complete. Returns summary statistics."""
+    batch_id = uuid.uuid4().hex[:8]
+    latencies, errors, cached = [], 0, 0
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_item, console, item, batch_id) for item in requests]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            if "error" in result:
+                errors += 1
+            else:
+                latencies.append(result["latency"])
+                cached += bool(result.get("cached"))
+            if progress:
+                progress(done, len(futures))
+    elapsed = time.perf_counter() - started_at
+    return {
+        'items': len(latencies) + errors,
+        'errors': errors,
+        'cached': cached,
+        'elapsed': elapsed,
+        'throughput': (len(latencies) + errors) / elapsed if elapsed > 0 else 0.0,
+        'p50_latency': percentile(latencies, 50),
+        'p95_latency': percentile(latencies, 95),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a JSONL file of CodeBuddy assistant requests.")
+    parser.add_argument("input", help="JSONL requests, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results (default stdout)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--server", default=os.environ.get("CODEBUDDY_SERVER_URL"),
+                        help="send requests to a CodeBuddy server instead of running in-process")
+    args = parser.parse_args(argv)
+
+    if args.server:
+        from remote_console import RemoteCodeBuddyConsole
+        console = RemoteCodeBuddyConsole(args.server)
+    else:
+        from main import CodeBuddyConsole
+        console = CodeBuddyConsole()
+
+    def report(done, total):
+        if done % 10 == 0 or done == total:
+            print(f"  {done}/{total} requests done", file=sys.stderr, flush=True)
+
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        summary = run_batch(console, list(read_requests(args.input)), output, args.concurrency, report)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        console.close()
+
+    def seconds(value):
+        return f"{value:.2f}s" if value is not None else "n/a"
+
+    print(
+        f"{summary['items']} requests in {summary['elapsed']:.2f}s "
+        f"({summary['throughput']:.2f} req/sec, concurrency {args.concurrency}); "
+        f"p50 {seconds(summary['p50_latency'])}, p95 {seconds(summary['p95_latency'])}; "
+        f"{summary['cached']} from cache, {summary['errors']} failed",
+        file=sys.stderr
+    )
+
+
+if __name__ == "__main__":
+    main()
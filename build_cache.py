@@ -0,0 +1,99 @@
+import os
+import shutil
+import hashlib
+import threading
+import subprocess
+from functools import lru_cache
+
+# Compiled binaries, addressed by what went into them: unchanged code is run from
+# here without calling the compiler again.
+BUILD_CACHE_DIR = "build_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def compiler_version(compiler):
+    """Resolved path and version banner of `compiler`, so upgrading or switching
+    compilers invalidates earlier builds."""
+    path = shutil.which(compiler) or compiler
+    try:
+        banner = subprocess.run(
+            [path, "--version"], capture_output=True, text=True, timeout=10
+        ).stdout.splitlines()
+    except (OSError, subprocess.SubprocessError):
+        banner = []
+    return f"{os.path.realpath(path)} {banner[0] if banner else 'unknown'}"
+
+
+class BuildCache:
+    """Size-bounded, least-recently-used store of compiled binaries on disk.
+
+    Entries are keyed on the source, language, compiler version and flags. A hit
+    refreshes the entry's mtime; once the directory grows past `max_bytes` the
+    entries used longest ago are deleted."""
+
+    def __init__(self, directory=BUILD_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, code, language, flags):
+        digest = hashlib.sha256()
+        for part in (language, compiler_version(flags[0]), "\0".join(flags), code):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Path of the cached binary for `key`, or None."""
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key, binary_path):
+        """Copies a freshly built binary into the cache and returns its cached path."""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copy2(binary_path, temp_path)
+        os.replace(temp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                # A binary that is running can still be unlinked on POSIX; elsewhere
+                # it stays until a later eviction.
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,76 @@
+import threading
+
+CANCELLED = "cancelled"
+TIMED_OUT = "timeout"
+# The consumer stopped reading the response stream.
+CLOSED = "closed"
+
+
+class CancelToken:
+    """Cancellation signal shared by whoever runs a request and whoever may stop it.
+
+    `cancel` may be called from any thread. Callbacks registered with `on_cancel`
+    run on the cancelling thread, which is how a blocked HTTP read gets aborted.
+    `set_timeout` arms a timer that cancels the token with reason TIMED_OUT."""
+
+    def __init__(self):
+        self.reason = None
+        self.timeout = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason=CANCELLED):
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        for callback in callbacks:
+            callback(reason)
+        return True
+
+    def on_cancel(self, callback):
+        """Registers `callback(reason)`, calling it at once if already cancelled.
+        Returns a function that unregisters it."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback(self.reason)
+        return lambda: None
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def set_timeout(self, seconds):
+        with self._lock:
+            if self._event.is_set() or seconds is None:
+                return
+            if self._timer is not None:
+                self._timer.cancel()
+            self.timeout = seconds
+            self._timer = threading.Timer(seconds, self.cancel, args=(TIMED_OUT,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def close(self):
+        """Disarms the timeout once the request is over."""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
@@ -1,98 +1,223 @@
 import os
+import time
+import codecs
+import shutil
 import tempfile
 import subprocess
-import sys
-import select
-import shutil
-from PyQt6.QtWidgets import QInputDialog
+from PyQt6.QtCore import QObject, QProcess
+from PyQt6.QtGui import QColor, QTextCharFormat, QTextCursor
+from metrics import metrics, span, format_timings
+from build_cache import BuildCache
+
+# Compiler and flags per language; the source comes on stdin and the output path is
+# added per build. Changing them invalidates cached builds.
+COMPILE_FLAGS = {
+    "c": ['gcc', '-x', 'c'],
+    "c++": ['g++', '-x', 'c++'],
+}
+
+# stdout to a pipe is block-buffered in C, so a prompt printed before scanf would
+# only show up once the program exits. stdbuf (GNU coreutils) turns that off.
+UNBUFFERED_PREFIX = ['stdbuf', '-o0', '-e0'] if shutil.which('stdbuf') else []
+
+STDERR_COLOR = "red"
+INPUT_COLOR = "gray"
+
+class RunSession(QObject):
+    """One execution of a program: a single QProcess whose stdout and stderr are
+    streamed into the output console as they arrive, and whose stdin is fed by
+    `write` as the user types. `on_finished(outcome, seconds)` is called once the
+    process is gone."""
+
+    def __init__(self, output_console, command, on_finished):
+        super().__init__()
+        self.output_console = output_console
+        self.on_finished = on_finished
+        self.stopped = False
+        self.done = False
+        self.started_at = None
+        # Incremental, so a UTF-8 character split across two reads isn't mangled.
+        self._stdout_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._stderr_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        self.process = QProcess(self)
+        self.process.setProgram(command[0])
+        self.process.setArguments(command[1:])
+        self.process.readyReadStandardOutput.connect(self._read_stdout)
+        self.process.readyReadStandardError.connect(self._read_stderr)
+        self.process.finished.connect(self._finished)
+        self.process.errorOccurred.connect(self._error)
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.process.start()
+
+    def is_running(self):
+        return self.process.state() != QProcess.ProcessState.NotRunning
+
+    def write(self, text):
+        self.append(text, INPUT_COLOR)
+        self.process.write(text.encode("utf-8"))
+
+    def close_input(self):
+        self.process.closeWriteChannel()
+
+    def stop(self):
+        if self.is_running():
+            self.stopped = True
+            self.process.kill()
+            self.process.waitForFinished(1000)
+
+    def append(self, text, color=None):
+        cursor = self.output_console.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        text_format = QTextCharFormat()
+        if color:
+            text_format.setForeground(QColor(color))
+        cursor.insertText(text, text_format)
+        self.output_console.setTextCursor(cursor)
+        self.output_console.ensureCursorVisible()
+
+    def _read_stdout(self):
+        self.append(self._stdout_decoder.decode(bytes(self.process.readAllStandardOutput())))
+
+    def _read_stderr(self):
+        self.append(self._stderr_decoder.decode(bytes(self.process.readAllStandardError())), STDERR_COLOR)
+
+    def _finished(self, exit_code, exit_status):
+        self._read_stdout()
+        self._read_stderr()
+        if self.stopped:
+            self._done("stopped", "⏹ Program stopped")
+        elif exit_status == QProcess.ExitStatus.CrashExit:
+            self._done("runtime_error", "❌ Program crashed")
+        elif exit_code != 0:
+            self._done("runtime_error", f"❌ Program exited with code {exit_code}")
+        else:
+            self._done("ok", "✅ Program finished")
+
+    def _error(self, error):
+        # Other errors (crashes, failed writes) are followed by `finished`.
+        if error == QProcess.ProcessError.FailedToStart:
+            self._done("error", f"⚠️ Error occurred: {self.process.errorString()}")
+
+    def _done(self, outcome, message):
+        if self.done:
+            return
+        self.done = True
+        self.append(("\n" if self.output_console.toPlainText().endswith("\n") else "\n\n") + message)
+        self.on_finished(outcome, time.perf_counter() - self.started_at)
+
 
 class CompileRun:
-    def __init__(self, output_console):
+    def __init__(self, output_console, show_status=None, build_cache=None):
         self.output_console = output_console
+        self.build_cache = build_cache or BuildCache()
+        # e.g. a status bar's showMessage; gets the last run's timing breakdown.
+        self.show_status = show_status
+        self.session = None
 
     def compile_and_run(self, code, language):
         if not code.strip():
             self.output_console.setText("⚠️ No code to compile!")
             return
+        # One program at a time: a new Run replaces one that is still running.
+        self.stop()
 
-        tempdir = tempfile.mkdtemp() 
+        started_at = time.perf_counter()
+        timings = {}
+        tempdir = tempfile.mkdtemp()
         output_file = os.path.join(tempdir, 'temp.out')
 
+        def finish(outcome):
+            self.cleanup(tempdir)
+            self.record_run(timings, outcome, time.perf_counter() - started_at)
+
         try:
-            if language == "c":
-                compileCommand = ['gcc', '-x', 'c', '-', '-o', output_file]
-            elif language == "c++":
-                compileCommand = ['g++', '-x', 'c++', '-', '-o', output_file]
+            if language in COMPILE_FLAGS:
+                compileCommand = COMPILE_FLAGS[language] + ['-', '-o', output_file]
             elif language == "java":
                 compileCommand = ['javac', '-d', tempdir, '-']
                 output_file = os.path.join(tempdir, 'Main')
             elif language == "python":
-                compileCommand = ['python3', '-c', code]
+                compileCommand = ['python3', '-u', '-c', code]
                 output_file = None
             else:
                 self.output_console.setText("❌ Unsupported language!")
+                finish("unsupported")
                 return
 
+            build_note = ""
+            if language in COMPILE_FLAGS:
+                cache_key = self.build_cache.key(code, language, COMPILE_FLAGS[language])
+                cached_binary = self.build_cache.get(cache_key)
+                if cached_binary is not None:
+                    output_file = cached_binary
+                    build_note = "⚡ Code unchanged since its last build, compile skipped.\n\n"
+
             # **Compile Code**
-            if language != "python":
-                compileProcess = subprocess.Popen(
-                    compileCommand, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-                )
-                compileStdout, compileStderr = compileProcess.communicate(input=code.encode('utf-8'))
+            if language != "python" and not build_note:
+                with span(timings, 'compile'):
+                    compileProcess = subprocess.Popen(
+                        compileCommand, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+                    )
+                    compileStdout, compileStderr = compileProcess.communicate(input=code.encode('utf-8'))
                 if compileProcess.returncode != 0:
                     self.output_console.setText(f"❌ Compilation Error:\n\n{compileStderr.decode()}")
+                    finish("compile_error")
                     return
+                if language in COMPILE_FLAGS:
+                    try:
+                        output_file = self.build_cache.put(cache_key, output_file)
+                    except OSError as e:
+                        print(f"⚠️ Could not cache the build: {e}")
 
             if language == "python":
                 runCommand = compileCommand
             else:
-                runCommand = [output_file]
-
-            runProcess = subprocess.Popen(
-                runCommand, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-
-            try:
-                if sys.platform != "win32":
-                    rlist, _, _ = select.select([runProcess.stdout, runProcess.stderr], [], [], 2)
-                else:
-                    runProcess.wait(timeout=2)
-                    rlist = []
-
-            except subprocess.TimeoutExpired:
-                rlist = [runProcess.stdout] 
-
-            if not rlist:
-                executionStdout, executionStderr = runProcess.communicate()
-                if executionStderr:
-                    self.output_console.setText(f"❌ Execution Error:\n\n{executionStderr}")
-                else:
-                    self.output_console.setText(f"✅ Output:\n\n{executionStdout}")
-                return
+                runCommand = UNBUFFERED_PREFIX + [output_file]
 
-            user_input, ok = QInputDialog.getMultiLineText(
-                None, "Program Input", "Enter input for program:"
-            )
-            if not ok:
-                user_input = ""
+        except Exception as e:
+            self.output_console.setText(f"⚠️ Error occurred: {str(e)}")
+            finish("error")
+            return
 
-            runProcess = subprocess.Popen(
-                runCommand, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            executionStdout, executionStderr = runProcess.communicate(input=user_input)
+        def on_finished(outcome, run_seconds):
+            timings['run'] = run_seconds
+            finish(outcome)
 
-            if executionStderr:
-                self.output_console.setText(f"❌ Execution Error:\n\n{executionStderr}")
-            else:
-                self.output_console.setText(f"✅ Output:\n\n{executionStdout}")
+        self.output_console.setText(f"{build_note}▶ Output (type the program's input below):\n\n")
+        self.session = RunSession(self.output_console, runCommand, on_finished)
+        self.session.start()
 
-        except Exception as e:
-            self.output_console.setText(f"⚠️ Error occurred: {str(e)}")
+    def send_input(self, text):
+        """Sends a line to the running program's stdin. Returns False if nothing is running."""
+        if self.session is None or not self.session.is_running():
+            if self.show_status is not None:
+                self.show_status("No program is running")
+            return False
+        self.session.write(text + "\n")
+        return True
+
+    def end_input(self):
+        """Closes the running program's stdin (end of file)."""
+        if self.session is not None and self.session.is_running():
+            self.session.close_input()
+
+    def stop(self):
+        if self.session is not None:
+            self.session.stop()
+
+    def cleanup(self, tempdir):
+        try:
+            shutil.rmtree(tempdir, ignore_errors=True)
+        except Exception as cleanup_error:
+            print(f"⚠️ Cleanup failed: {cleanup_error}")
 
-        finally:
-            try:
-                shutil.rmtree(tempdir, ignore_errors=True)
-            except Exception as cleanup_error:
-                print(f"⚠️ Cleanup failed: {cleanup_error}")
+    def record_run(self, timings, outcome, total):
+        metrics.record("compile_run", timings, outcome, total)
+        if self.show_status is not None:
+            status = f"Compile and run took {total:.2f}s"
+            if timings:
+                status += f" ({format_timings(timings)})"
+            self.show_status(status)
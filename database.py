@@ -1,8 +1,20 @@
+import queue
+import atexit
 import sqlite3
+import threading
+import time
+from collections import Counter
 
-def init_conversation_db():
-    conn = sqlite3.connect('conversation_history.db')
+CONVERSATION_DB = 'conversation_history.db'
+# Turns queued for write-behind are committed together at most this often.
+DEFAULT_FLUSH_INTERVAL = 0.25
+DEFAULT_MAX_BATCH = 500
+
+def init_conversation_db(db_path=CONVERSATION_DB):
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
+    # WAL lets the UI thread read history while a worker thread is writing a turn.
+    cursor.execute("PRAGMA journal_mode=WAL")
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS conversations (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -12,10 +24,249 @@ def init_conversation_db():
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_conversations_session_ts
+        ON conversations (session_id, timestamp)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversation_summaries (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT,
+            covered_until_id INTEGER,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
     conn.commit()
     conn.close()
 
-init_conversation_db()
+
+class ConversationStore:
+    """Data access for conversations and their rolling summaries.
+
+    Each thread gets one long-lived connection, opened on first use, so the
+    statements below stay compiled in that connection's statement cache. Turn
+    lookups walk idx_conversations_session_ts backwards and stop after `limit`
+    rows, so their cost doesn't grow with the table.
+
+    Turns passed to `queue_turn` are written behind by a ConversationWriter. Reads
+    for a session with queued turns wait for them to be committed first, so a
+    session always sees its own latest answer."""
+
+    def __init__(self, db_path=CONVERSATION_DB, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 max_batch=DEFAULT_MAX_BATCH):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = None
+        init_conversation_db(db_path)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def add_turn(self, session_id, user_query, ai_response):
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute('''
+                INSERT INTO conversations (session_id, user_query, ai_response)
+                VALUES (?, ?, ?)
+            ''', (session_id, user_query, ai_response))
+        return cursor.lastrowid
+
+    def add_turns(self, turns):
+        """Inserts (session_id, user_query, ai_response) tuples in one transaction."""
+        conn = self._conn()
+        with conn:
+            conn.executemany('''
+                INSERT INTO conversations (session_id, user_query, ai_response)
+                VALUES (?, ?, ?)
+            ''', turns)
+
+    def queue_turn(self, session_id, user_query, ai_response):
+        with self._lock:
+            if self._writer is None:
+                self._writer = ConversationWriter(self, self.flush_interval, self.max_batch)
+            writer = self._writer
+        writer.submit(session_id, user_query, ai_response)
+
+    def _wait_for_pending(self, session_id=None):
+        writer = self._writer
+        if writer is not None and writer.has_pending(session_id):
+            writer.flush(session_id)
+
+    def recent_turns(self, session_id, limit, after_id=0):
+        """Returns up to `limit` of the session's newest turns with id > after_id,
+        as (id, user_query, ai_response) tuples, oldest first."""
+        self._wait_for_pending(session_id)
+        rows = self._conn().execute('''
+            SELECT id, user_query, ai_response FROM conversations
+            WHERE session_id = ? AND id > ?
+            ORDER BY timestamp DESC, id DESC
+            LIMIT ?
+        ''', (session_id, after_id, limit)).fetchall()
+        rows.reverse()
+        return rows
+
+    def turns_between(self, session_id, after_id, before_id):
+        """Returns the session's turns with after_id < id < before_id, oldest first."""
+        self._wait_for_pending(session_id)
+        return self._conn().execute('''
+            SELECT id, user_query, ai_response FROM conversations
+            WHERE session_id = ? AND id > ? AND id < ?
+            ORDER BY timestamp, id
+        ''', (session_id, after_id, before_id)).fetchall()
+
+    def history(self, session_id):
+        self._wait_for_pending(session_id)
+        return self._conn().execute('''
+            SELECT user_query, ai_response FROM conversations
+            WHERE session_id = ?
+            ORDER BY timestamp, id
+        ''', (session_id,)).fetchall()
+
+    def get_summary(self, session_id):
+        """Returns (summary, covered_until_id), or ("", 0) if the session has none."""
+        row = self._conn().execute(
+            "SELECT summary, covered_until_id FROM conversation_summaries WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        return row if row else ("", 0)
+
+    def save_summary(self, session_id, summary, covered_until_id):
+        conn = self._conn()
+        with conn:
+            conn.execute('''
+                INSERT INTO conversation_summaries (session_id, summary, covered_until_id)
+                VALUES (?, ?, ?)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    summary = excluded.summary,
+                    covered_until_id = excluded.covered_until_id,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (session_id, summary, covered_until_id))
+
+    def close(self):
+        with self._lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+
+class ConversationWriter:
+    """Background writer that takes conversation turns off the request path.
+
+    Turns are queued by `submit` and committed by a single thread, one transaction
+    per `flush_interval` (or per `max_batch` turns), so answering threads never wait
+    on a commit and never contend with each other for SQLite's write lock. `close`
+    commits everything still queued; it is also registered with atexit."""
+
+    _FLUSH = object()
+    _STOP = object()
+
+    def __init__(self, store, flush_interval=DEFAULT_FLUSH_INTERVAL, max_batch=DEFAULT_MAX_BATCH):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._pending = Counter()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.batches_written = 0
+        self.turns_written = 0
+        self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, session_id, user_query, ai_response):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ConversationWriter is closed")
+            self._pending[session_id] += 1
+        self._queue.put((session_id, user_query, ai_response))
+
+    def has_pending(self, session_id=None):
+        with self._cond:
+            return self._pending[session_id] > 0 if session_id is not None else bool(self._pending)
+
+    def flush(self, session_id=None, timeout=None):
+        """Blocks until the queued turns (of one session, or all) are committed.
+        Returns False if `timeout` ran out first."""
+        self._queue.put(self._FLUSH)
+        with self._cond:
+            return self._cond.wait_for(lambda: not self.has_pending(session_id), timeout)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                elif item is not self._FLUSH:
+                    batch.append(item)
+                if stopping or item is self._FLUSH or len(batch) >= self.max_batch:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if stopping or item is self._FLUSH:
+                # Drain whatever is already queued so a stop or flush never leaves turns behind.
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stopping = True
+                    elif item is not self._FLUSH:
+                        batch.append(item)
+            self._write(batch)
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self.store.add_turns(batch)
+            self.batches_written += 1
+            self.turns_written += len(batch)
+        except Exception as e:
+            print(f"⚠️ Failed to save {len(batch)} conversation turn(s): {e}")
+        finally:
+            with self._cond:
+                for session_id, _, _ in batch:
+                    self._pending[session_id] -= 1
+                    if not self._pending[session_id]:
+                        del self._pending[session_id]
+                self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+        atexit.unregister(self.close)
+        self._queue.put(self._STOP)
+        self._thread.join()
+
 
 
 
@@ -0,0 +1,121 @@
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingModelRegistry:
+    """Loads each SentenceTransformer once per process and shares it across threads."""
+
+    def __init__(self, query_cache_size=512):
+        self.query_cache_size = query_cache_size
+        self._models = {}
+        self.load_seconds = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self._query_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def get_model(self, model_name=DEFAULT_MODEL_NAME):
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+
+        with self._lock:
+            load_lock = self._load_locks.setdefault(model_name, threading.Lock())
+
+        # Only one thread pays the load for a given model; the others wait on it.
+        with load_lock:
+            model = self._models.get(model_name)
+            if model is None:
+                started_at = time.perf_counter()
+                # Imported here: sentence_transformers pulls in torch, which takes
+                # seconds, and nothing needs it until the first embedding.
+                from sentence_transformers import SentenceTransformer
+                model = SentenceTransformer(model_name)
+                self.load_seconds[model_name] = time.perf_counter() - started_at
+                self._models[model_name] = model
+        return model
+
+    def register_model(self, model_name, model):
+        """Makes `model` (anything with a SentenceTransformer-style `encode`) the one
+        served for `model_name`, e.g. a deterministic stand-in for benchmarks."""
+        with self._lock:
+            self._models[model_name] = model
+        with self._cache_lock:
+            for key in [key for key in self._query_cache if key[0] == model_name]:
+                del self._query_cache[key]
+
+    def is_loaded(self, model_name=DEFAULT_MODEL_NAME):
+        return model_name in self._models
+
+    def warmup(self, model_name=DEFAULT_MODEL_NAME, background=True):
+        def _warm():
+            try:
+                self.get_model(model_name).encode(["warmup"])
+            except Exception as e:
+                print(f"⚠️ Embedding model warmup failed: {e}")
+
+        if not background:
+            _warm()
+            return None
+        thread = threading.Thread(target=_warm, name=f"warmup-{model_name}", daemon=True)
+        thread.start()
+        return thread
+
+    def embed_query(self, text, model_name=DEFAULT_MODEL_NAME):
+        key = (model_name, text)
+        with self._cache_lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+                self.cache_hits += 1
+                return cached
+            self.cache_misses += 1
+
+        embedding = np.asarray(self.get_model(model_name).encode([text])[0], dtype=np.float32)
+        embedding.setflags(write=False)
+
+        with self._cache_lock:
+            self._query_cache[key] = embedding
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return embedding
+
+    def encode(self, texts, model_name=DEFAULT_MODEL_NAME, batch_size=32):
+        return np.asarray(
+            self.get_model(model_name).encode(list(texts), batch_size=batch_size),
+            dtype=np.float32
+        )
+
+    def clear_query_cache(self):
+        with self._cache_lock:
+            self._query_cache.clear()
+
+
+registry = EmbeddingModelRegistry()
+
+
+def get_model(model_name=DEFAULT_MODEL_NAME):
+    return registry.get_model(model_name)
+
+
+def register_model(model_name, model):
+    registry.register_model(model_name, model)
+
+
+def warmup(model_name=DEFAULT_MODEL_NAME, background=True):
+    return registry.warmup(model_name, background=background)
+
+
+def embed_query(text, model_name=DEFAULT_MODEL_NAME):
+    return registry.embed_query(text, model_name)
+
+
+def generate_embeddings(text, model_name=DEFAULT_MODEL_NAME):
+    return embed_query(text, model_name).tolist()
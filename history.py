@@ -0,0 +1,96 @@
+import threading
+from prompts import SUMMARY_TEMPLATE
+from database import ConversationStore
+
+DEFAULT_MAX_RECENT_TURNS = 6
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_SUMMARY_WORDS = 250
+# Rough chars-per-token ratio for code and English; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class HistoryManager:
+    """Keeps the prompt's chat history a bounded size however long a session runs.
+
+    The newest turns (up to `max_recent_turns`, within `token_budget`) go into the
+    prompt verbatim. Older turns are folded into a per-session rolling summary by a
+    background LLM call and stored in conversation_summaries, so they are never
+    re-read once summarized. Building the context reads at most
+    `max_recent_turns + 1` rows, however long the session is."""
+
+    def __init__(self, llm_client, store=None, max_recent_turns=DEFAULT_MAX_RECENT_TURNS,
+                 token_budget=DEFAULT_TOKEN_BUDGET, summary_words=DEFAULT_SUMMARY_WORDS):
+        self.llm_client = llm_client
+        self.store = store or ConversationStore()
+        self.max_recent_turns = max_recent_turns
+        self.token_budget = token_budget
+        self.summary_words = summary_words
+        self._summarizing = set()
+        self._lock = threading.Lock()
+
+    def context(self, session_id):
+        """Returns (recent_turns, summary) where recent_turns is a list of
+        (user_query, ai_response) pairs, oldest first."""
+        summary, covered_until_id = self.store.get_summary(session_id)
+        # One extra row tells us whether anything older is waiting to be summarized.
+        turns = self.store.recent_turns(session_id, self.max_recent_turns + 1, covered_until_id)
+
+        recent = []
+        used_tokens = estimate_tokens(summary)
+        for turn in reversed(turns):
+            turn_tokens = estimate_tokens(turn[1]) + estimate_tokens(turn[2])
+            if recent and (len(recent) >= self.max_recent_turns or used_tokens + turn_tokens > self.token_budget):
+                break
+            if not recent and used_tokens + turn_tokens > self.token_budget:
+                # The newest turn is always kept, clipped so it alone can't blow the budget.
+                room = max(self.token_budget - used_tokens - estimate_tokens(turn[1]), 0) * CHARS_PER_TOKEN
+                turn = (turn[0], turn[1], turn[2][:room])
+            recent.append(turn)
+            used_tokens += turn_tokens
+        recent.reverse()
+
+        if len(turns) > len(recent):
+            self._summarize_async(session_id, summary, covered_until_id, recent[0][0])
+
+        return [(query, response) for _, query, response in recent], summary
+
+    def format(self, recent_turns, summary):
+        lines = []
+        if summary:
+            lines.append(f"Summary of the earlier conversation: {summary}")
+        lines.extend(f"User: {q}\nAI: {a}" for q, a in recent_turns)
+        return "\n".join(lines)
+
+    def _summarize_async(self, session_id, summary, covered_until_id, before_id):
+        with self._lock:
+            if session_id in self._summarizing:
+                return
+            self._summarizing.add(session_id)
+        thread = threading.Thread(
+            target=self._summarize, args=(session_id, summary, covered_until_id, before_id),
+            name=f"summarize-{session_id}", daemon=True
+        )
+        thread.start()
+        return thread
+
+    def _summarize(self, session_id, summary, covered_until_id, before_id):
+        try:
+            turns = self.store.turns_between(session_id, covered_until_id, before_id)
+            if not turns:
+                return
+            prompt = SUMMARY_TEMPLATE.format(
+                max_words=self.summary_words,
+                summary=summary or "(none)",
+                turns="\n".join(f"User: {q}\nAI: {a}" for _, q, a in turns)
+            )
+            new_summary = self.llm_client.generate(prompt, temperature=0.0).strip()
+            self.store.save_summary(session_id, new_summary, turns[-1][0])
+        except Exception as e:
+            print(f"⚠️ Conversation summarization failed: {e}")
+        finally:
+            with self._lock:
+                self._summarizing.discard(session_id)
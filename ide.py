@@ -1,15 +1,18 @@
 import os
 from PyQt6.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTabWidget, QTextEdit,
-    QTextBrowser, QToolBar, QPushButton, QSplitter, QFileDialog, QMessageBox,QComboBox, QLabel, QFrame,QMenu
+    QTextBrowser, QToolBar, QPushButton, QSplitter, QFileDialog, QMessageBox,QComboBox, QLabel, QFrame,QMenu,
+    QLineEdit
 )
-from PyQt6.QtGui import QFont,QCursor,QAction,QPalette,QColor
+from PyQt6.QtGui import QFont,QCursor,QAction,QPalette,QColor,QShortcut,QKeySequence
 from PyQt6.QtCore import Qt, QTimer
 from editor import CodeEditor
 from explorer_sidebar import ExplorerSidebar
-from main import CodeBuddyConsole
 from compile_run import CompileRun
 from ai_assistant import AIAssistantHandler
+from remote_console import SERVER_URL_ENV, RemoteCodeBuddyConsole
+from startup import BackgroundLoader, since_start
+from metrics import metrics
 class IDE(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -22,9 +25,51 @@ class IDE(QMainWindow):
         self.initAutoSave()
         self.initTheme()
 
-        self.code_buddy = CodeBuddyConsole()
-        self.compile_run = CompileRun(self.outputConsole)
+        server_url = os.environ.get(SERVER_URL_ENV)
+        self.code_buddy = None
+        self.window_shown_after = None
+        if server_url:
+            # A shared server owns the models; nothing to load here.
+            self.assistant_backend = RemoteCodeBuddyConsole(server_url)
+        else:
+            # The AI stack (numpy, the embedding model and torch) loads in the background
+            # once the window is up. An Assist request made before then waits for it.
+            self.assistant_backend = BackgroundLoader(self.load_assistant_backend, "AI assistant")
+        self.compile_run = CompileRun(self.outputConsole, self.statusBar().showMessage)
+        # Runs on the first event loop iteration, i.e. once the window has been shown.
+        QTimer.singleShot(0, self.on_window_shown)
+
+    def load_assistant_backend(self):
+        from main import CodeBuddyConsole
+        from async_console import AsyncCodeBuddyConsole, AsyncConsoleBridge
+        from embedding_model import warmup as warmup_embedding_model
 
+        self.code_buddy = CodeBuddyConsole()
+        warmup_embedding_model()
+        self.code_buddy.llm_client.warmup()
+        backend = AsyncConsoleBridge(AsyncCodeBuddyConsole(self.code_buddy))
+        metrics.observe("startup", "assistant_ready", since_start())
+        return backend
+
+    def on_window_shown(self):
+        self.window_shown_after = since_start()
+        metrics.observe("startup", "window_shown", self.window_shown_after)
+        self.statusBar().showMessage(f"Ready in {self.window_shown_after:.2f}s")
+        if isinstance(self.assistant_backend, BackgroundLoader):
+            self.assistant_backend.start()
+
+    def closeEvent(self, event):
+        self.compile_run.stop()
+        self.ai_assistant.close()
+        backend = self.assistant_backend
+        if isinstance(backend, BackgroundLoader):
+            # Don't hold up closing for a backend that is still loading.
+            backend = backend.get_if_ready()
+        if backend is not None:
+            backend.close()
+        if self.code_buddy is not None:
+            self.code_buddy.close()
+        super().closeEvent(event)
 
     def initUI(self):
         centralWidget = QWidget(self)
@@ -58,6 +103,19 @@ class IDE(QMainWindow):
         self.outputConsole.setPlaceholderText("Compilation and execution output will appear here...")
         self.middleLayout.addWidget(self.outputConsole, 1)
 
+        # stdin of the running program: Enter sends the line, Ctrl+D ends the input.
+        self.programInputRow = QHBoxLayout()
+        self.programInput = QLineEdit()
+        self.programInput.setFont(QFont("Courier", 11))
+        self.programInput.setPlaceholderText("Program input: press Enter to send, Ctrl+D for end of input")
+        self.programInput.returnPressed.connect(self.send_program_input)
+        QShortcut(QKeySequence("Ctrl+D"), self.programInput, activated=self.end_program_input)
+        self.programInputRow.addWidget(self.programInput)
+        self.stopProgramButton = QPushButton("Stop Program")
+        self.stopProgramButton.clicked.connect(self.stop_program)
+        self.programInputRow.addWidget(self.stopProgramButton)
+        self.middleLayout.addLayout(self.programInputRow)
+
         self.mainSplitter.addWidget(self.middleContent)
 
         self.rightSidebar = QWidget()
@@ -86,6 +144,10 @@ class IDE(QMainWindow):
         self.assistButton.clicked.connect(self.ai_assistant.assist_code)
         self.rightControlsLayout.addWidget(self.assistButton)
 
+        self.stopButton = QPushButton("Stop")
+        self.stopButton.clicked.connect(self.ai_assistant.stop)
+        self.rightControlsLayout.addWidget(self.stopButton)
+
         self.rightSidebarLayout.addWidget(self.rightControls)
 
         self.aiPanel = QTextBrowser() 
@@ -178,6 +240,17 @@ class IDE(QMainWindow):
         code = editor.toPlainText()
         language = self.languageSelector.currentText().lower()
         self.compile_run.compile_and_run(code, language)
+        self.programInput.setFocus()
+
+    def send_program_input(self):
+        if self.compile_run.send_input(self.programInput.text()):
+            self.programInput.clear()
+
+    def end_program_input(self):
+        self.compile_run.end_input()
+
+    def stop_program(self):
+        self.compile_run.stop()
 
     def open_file(self):
         fileName, _ = QFileDialog.getOpenFileName(self, "Open File", "", "All Files (*)")
@@ -1,7 +1,19 @@
+import os
+import argparse
 import sqlite3
-from sentence_transformers import SentenceTransformer
+import time
 import pymupdf
 import numpy as np
+from embedding_model import DEFAULT_MODEL_NAME, embed_query, get_model
+from retrieval import EMBEDDINGS_DB, get_index
+from quantization import MODES
+from lexical_index import create_fts_table, fts_table_exists, index_chunks, remove_chunks
+from vector_store import (
+    STORES, bump_corpus_version, content_hash, create_meta_table, open_store, set_meta, set_quantization
+)
+from ann_index import build_sidecar, sidecar_path, update_sidecar
+
+DEFAULT_BATCH_SIZE = 64
 
 
 def extract_text_from_pdf(pdf_path):
@@ -10,9 +22,8 @@ def extract_text_from_pdf(pdf_path):
     return text
 
 
-def generate_embeddings(text, model_name="sentence-transformers/all-MiniLM-L6-v2"):
-    model = SentenceTransformer(model_name)
-    return model.encode([text])[0].tolist()  
+def generate_embeddings(text, model_name=DEFAULT_MODEL_NAME):
+    return get_model(model_name).encode([text])[0].tolist()
 
 
 def chunk_text(text, chunk_size=1000, overlap_size=80):
@@ -26,70 +37,189 @@ def chunk_text(text, chunk_size=1000, overlap_size=80):
     return chunks
 
 
-def create_db():
-    conn = sqlite3.connect("embeddings.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS embeddings (
-            doc_id TEXT,
-            chunk_id INTEGER,
-            chunk TEXT,
-            embedding BLOB
+def create_db(db_path=EMBEDDINGS_DB, storage=None):
+    conn = sqlite3.connect(db_path)
+    create_meta_table(conn)
+    store = open_store(conn, db_path, storage)
+    if store.create_schema(conn):
+        # Migration renumbers rowids, so any IVF sidecar has to be retrained.
+        if os.path.exists(sidecar_path(db_path)):
+            build_sidecar(db_path)
+    set_meta(conn, "storage", store.kind)
+    create_fts_table(conn, store)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            doc_id TEXT PRIMARY KEY,
+            source_path TEXT,
+            content_hash TEXT NOT NULL,
+            chunk_count INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
     conn.commit()
-    return conn
-
-
-def embed_pdf(pdf_path, doc_id):
-    text = extract_text_from_pdf(pdf_path)
-    chunks = chunk_text(text)
-    conn = create_db()
-
-    model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    
-    for chunk_id, chunk in enumerate(chunks):
-        embedding = generate_embeddings(chunk)
-        embedding_blob = np.array(embedding, dtype=np.float32).tobytes()
-        
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO embeddings (doc_id, chunk_id, chunk, embedding)
-            VALUES (?, ?, ?, ?)
-        ''', (doc_id, chunk_id, chunk, embedding_blob))
-        conn.commit()
-
-    print(f"PDF '{pdf_path}' embedded successfully.")
-
-
-def search_pdf(query, top_k=3, model_name="sentence-transformers/all-MiniLM-L6-v2"):
-    conn = sqlite3.connect("embeddings.db")
-    cursor = conn.cursor()
-
-    query_embedding = generate_embeddings(query, model_name)
-    query_embedding_array = np.array(query_embedding, dtype=np.float32)
-
-    cursor.execute('''
-        SELECT doc_id, chunk_id, chunk, embedding
-        FROM embeddings
-    ''')
-
-    results = []
-    for doc_id, chunk_id, chunk, embedding_blob in cursor.fetchall():
-        embedding = np.frombuffer(embedding_blob, dtype=np.float32)
-        similarity = np.dot(query_embedding_array, embedding) / (np.linalg.norm(query_embedding_array) * np.linalg.norm(embedding))
-        results.append((similarity, doc_id, chunk_id, chunk))
+    return conn, store
 
-    results.sort(reverse=True, key=lambda x: x[0])
 
-    return results[:top_k]
+def embed_chunks(chunks, model_name=DEFAULT_MODEL_NAME, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+    model = get_model(model_name)
+    # Bucket chunks of similar length into the same batch so padding stays small.
+    order = sorted(range(len(chunks)), key=lambda i: len(chunks[i]))
+    embeddings = None
 
-
-pdf_path = "CBook.pdf"
-embed_pdf(pdf_path, doc_id="doc_1")
-
-query = "Find information about fork()"
-search_results = search_pdf(query)
-
-for score, doc_id, chunk_id, chunk in search_results:
-    print(f"Score: {score}\nDoc ID: {doc_id}\nChunk: {chunk}\n")
+    for start in range(0, len(order), batch_size):
+        batch_ids = order[start:start + batch_size]
+        batch = np.asarray(
+            model.encode([chunks[i] for i in batch_ids], batch_size=batch_size),
+            dtype=np.float32
+        )
+        if embeddings is None:
+            embeddings = np.empty((len(chunks), batch.shape[1]), dtype=np.float32)
+        embeddings[batch_ids] = batch
+        if progress:
+            progress(min(start + batch_size, len(order)), len(order))
+
+    if embeddings is None:
+        return np.empty((0, 0), dtype=np.float32)
+    return embeddings
+
+
+def report_progress(started_at):
+    def _report(done, total):
+        elapsed = time.perf_counter() - started_at
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"  embedded {done}/{total} chunks ({rate:.1f} chunks/sec)", flush=True)
+    return _report
+
+
+def embed_pdf(pdf_path, doc_id, batch_size=DEFAULT_BATCH_SIZE, db_path=EMBEDDINGS_DB, force=False, storage=None):
+    """Ingests a PDF idempotently: an unchanged document is skipped, and otherwise
+    only chunks whose content hash changed are re-embedded. Chunks past the new
+    end of the document are deleted."""
+    started_at = time.perf_counter()
+    text = extract_text_from_pdf(pdf_path)
+    document_hash = content_hash(text)
+
+    conn, store = create_db(db_path, storage)
+    try:
+        registered = conn.execute(
+            "SELECT content_hash FROM documents WHERE doc_id = ?", (doc_id,)
+        ).fetchone()
+        if registered and registered[0] == document_hash and not force:
+            print(f"PDF '{pdf_path}' is unchanged since the last ingest; skipping.")
+            return 0
+
+        chunks = chunk_text(text)
+        chunk_hashes = [content_hash(chunk) for chunk in chunks]
+        existing = store.chunk_state(conn, doc_id)
+
+        changed = [
+            chunk_id for chunk_id, chunk_hash in enumerate(chunk_hashes)
+            if force or existing.get(chunk_id, (None, None))[1] != chunk_hash
+        ]
+        stale = [chunk_id for chunk_id in existing if chunk_id >= len(chunks)]
+        removed_rowids = [existing[chunk_id][0] for chunk_id in changed + stale if chunk_id in existing]
+
+        embeddings = embed_chunks(
+            [chunks[chunk_id] for chunk_id in changed],
+            batch_size=batch_size,
+            progress=report_progress(started_at)
+        )
+        rows = [
+            (chunk_id, chunks[chunk_id], embeddings[i], chunk_hashes[chunk_id])
+            for i, chunk_id in enumerate(changed)
+        ]
+
+        # Changed chunks are deleted and re-inserted rather than updated in place so
+        # they get fresh rowids, which keeps the IVF sidecar's incremental update exact.
+        with conn:
+            store.delete(conn, removed_rowids)
+            store.insert(conn, doc_id, rows)
+            if fts_table_exists(conn):
+                state = store.chunk_state(conn, doc_id)
+                remove_chunks(conn, removed_rowids)
+                index_chunks(conn, [(state[chunk_id][0], chunks[chunk_id]) for chunk_id in changed])
+            conn.execute('''
+                INSERT INTO documents (doc_id, source_path, content_hash, chunk_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(doc_id) DO UPDATE SET
+                    source_path = excluded.source_path,
+                    content_hash = excluded.content_hash,
+                    chunk_count = excluded.chunk_count,
+                    updated_at = CURRENT_TIMESTAMP
+            ''', (doc_id, pdf_path, document_hash, len(chunks)))
+            bump_corpus_version(conn)
+    finally:
+        conn.close()
+    update_sidecar(db_path, removed_rowids)
+
+    elapsed = time.perf_counter() - started_at
+    rate = len(changed) / elapsed if elapsed > 0 else 0.0
+    print(
+        f"PDF '{pdf_path}' embedded successfully: {len(changed)} of {len(chunks)} chunks re-embedded, "
+        f"{len(stale)} stale chunks removed in {elapsed:.1f}s ({rate:.1f} chunks/sec)."
+    )
+    return len(changed)
+
+
+def search_pdf(query, top_k=3, model_name=DEFAULT_MODEL_NAME):
+    query_embedding_array = embed_query(query, model_name)
+    return get_index().search(query_embedding_array, top_k)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest PDFs into the CodeBuddy embeddings database.")
+    parser.add_argument("--db", default=EMBEDDINGS_DB)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="embed one or more PDFs")
+    ingest_parser.add_argument("pdf_paths", nargs="+")
+    ingest_parser.add_argument("--doc-id", help="document id (defaults to the file name); only valid with a single PDF")
+    ingest_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    ingest_parser.add_argument("--force", action="store_true", help="re-embed every chunk even if unchanged")
+    ingest_parser.add_argument(
+        "--storage", choices=sorted(STORES), default=None,
+        help="vector storage backend for a new database (default sqlite)"
+    )
+
+    quantize_parser = subparsers.add_parser(
+        "quantize", help="migrate the database to quantized vectors (float32 copies are kept for rescoring)"
+    )
+    quantize_parser.add_argument("--mode", choices=MODES, required=True)
+
+    search_parser = subparsers.add_parser("search", help="query the embeddings database")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--top-k", type=int, default=3)
+    search_parser.add_argument("--mode", choices=("dense", "hybrid"), default="hybrid")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        if args.doc_id and len(args.pdf_paths) > 1:
+            parser.error("--doc-id can only be used with a single PDF")
+        for pdf_path in args.pdf_paths:
+            doc_id = args.doc_id or os.path.splitext(os.path.basename(pdf_path))[0]
+            embed_pdf(
+                pdf_path, doc_id, batch_size=args.batch_size, db_path=args.db,
+                force=args.force, storage=args.storage
+            )
+
+    elif args.command == "quantize":
+        conn, store = create_db(args.db)
+        try:
+            set_quantization(conn, store, args.mode)
+        finally:
+            conn.close()
+        print(f"'{args.db}' quantization set to {args.mode}.")
+
+    elif args.command == "search":
+        index = get_index(args.db)
+        if args.mode == "hybrid":
+            results = index.hybrid_search(args.query, embed_query, args.top_k)
+        else:
+            results = index.search(embed_query(args.query), args.top_k)
+        for score, doc_id, chunk_id, chunk in results:
+            print(f"Score: {score}\nDoc ID: {doc_id}\nChunk: {chunk}\n")
+
+
+if __name__ == "__main__":
+    main()
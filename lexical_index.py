@@ -0,0 +1,77 @@
+import re
+import sqlite3
+
+FTS_TABLE = "chunks_fts"
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_]+")
+# Punctuation that marks a query as a code identifier rather than prose, e.g.
+# "fork()", "pthread_create", "std::vector", "ptr->next", "#include".
+IDENTIFIER_PATTERN = re.compile(r"\w\(|_|::|->|\.\w|#\w")
+
+
+def fts_available(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp.fts_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp.fts_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def fts_table_exists(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone() is not None
+
+
+def create_fts_table(conn, store):
+    """Creates the FTS5 mirror of the chunk text, backfilling it from `store` the
+    first time. Returns False when this SQLite build has no FTS5."""
+    if fts_table_exists(conn):
+        return True
+    if not fts_available(conn):
+        return False
+    conn.execute(f'''
+        CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(chunk, tokenize = 'unicode61')
+    ''')
+    index_chunks(conn, store.iter_chunks(conn))
+    return True
+
+
+def index_chunks(conn, rowid_chunks):
+    """Mirrors (rowid, chunk) pairs into the FTS table under the store's rowids."""
+    conn.executemany(f"INSERT INTO {FTS_TABLE} (rowid, chunk) VALUES (?, ?)", rowid_chunks)
+
+
+def remove_chunks(conn, rowids):
+    conn.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+
+def query_terms(text):
+    return TOKEN_PATTERN.findall(text)
+
+
+def is_identifier_query(text):
+    return bool(IDENTIFIER_PATTERN.search(text)) and len(query_terms(text)) <= 3
+
+
+def match_expression(terms, require_all=False):
+    quoted = ['"' + term.replace('"', '""') + '"' for term in terms]
+    return (" AND " if require_all else " OR ").join(quoted)
+
+
+def search(conn, text, limit, require_all=False):
+    """Returns [(rowid, bm25)] best first. SQLite's bm25() is lower-is-better."""
+    terms = query_terms(text)
+    if not terms:
+        return []
+    try:
+        return conn.execute(f'''
+            SELECT rowid, bm25({FTS_TABLE}) AS rank
+            FROM {FTS_TABLE}
+            WHERE {FTS_TABLE} MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        ''', (match_expression(terms, require_all), limit)).fetchall()
+    except sqlite3.OperationalError:
+        return []
@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import queue
+import socket
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+DEFAULT_OLLAMA_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+DEFAULT_LLM_MODEL = "qwen2.5-coder:7b"
+DEFAULT_TIMEOUT = 300
+# How long Ollama keeps the model loaded after the last request.
+DEFAULT_KEEP_ALIVE = "30m"
+DEFAULT_POOL_SIZE = 4
+
+# Errors that mean a pooled keep-alive connection was closed by the server while idle.
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class OllamaError(Exception):
+    pass
+
+
+class GenerationCancelled(OllamaError):
+    """Raised when a request's CancelToken fires; `reason` is the token's reason."""
+
+    def __init__(self, reason):
+        super().__init__(f"Generation {reason}")
+        self.reason = reason
+
+
+def abort_connection(connection):
+    """Unblocks a thread reading from `connection` by shutting its socket down.
+    Ollama stops generating as soon as it sees the client go away."""
+    sock = connection.sock
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class OllamaClient:
+    """Long-lived client for Ollama's /api/generate endpoint. Connections are kept
+    alive and reused across requests, and every request asks Ollama to keep the
+    model resident for `keep_alive`."""
+
+    def __init__(self, model=DEFAULT_LLM_MODEL, base_url=DEFAULT_OLLAMA_URL, timeout=DEFAULT_TIMEOUT,
+                 keep_alive=DEFAULT_KEEP_ALIVE, pool_size=DEFAULT_POOL_SIZE):
+        if "://" not in base_url:
+            base_url = "http://" + base_url
+        parts = urlsplit(base_url)
+        self.model = model
+        self.base_url = base_url
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if parts.scheme == "https" else 11434)
+        self.scheme = parts.scheme or "http"
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.last_request_overhead = None
+        self.warmup_thread = None
+
+    def _new_connection(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        with self._stats_lock:
+            self.connections_opened += 1
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, connection, response):
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _payload(self, prompt, temperature, stream, options=None):
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": dict(options or {}, temperature=temperature),
+        }
+        return json.dumps(payload).encode("utf-8")
+
+    def _post(self, body, cancel=None):
+        """Sends a generate request, retrying once on a fresh connection if a pooled
+        one turns out to have been closed by the server. If `cancel` fires before the
+        response is fully read, the connection is shut down. Returns the connection,
+        the response and a function that disarms the shutdown."""
+        started_at = time.perf_counter()
+        while True:
+            if cancel is not None and cancel.cancelled:
+                raise GenerationCancelled(cancel.reason)
+            connection, reused = self._acquire()
+            disarm = cancel.on_cancel(lambda reason: abort_connection(connection)) if cancel is not None else (lambda: None)
+            try:
+                connection.request(
+                    "POST", "/api/generate", body=body, headers={"Content-Type": "application/json"}
+                )
+                response = connection.getresponse()
+            except Exception as e:
+                disarm()
+                connection.close()
+                if cancel is not None and cancel.cancelled:
+                    raise GenerationCancelled(cancel.reason) from e
+                if reused and isinstance(e, STALE_CONNECTION_ERRORS):
+                    continue
+                raise
+            break
+
+        # Time until response headers: connection setup plus request dispatch, the
+        # per-request cost that pooling is meant to remove.
+        with self._stats_lock:
+            self.requests += 1
+            self.last_request_overhead = time.perf_counter() - started_at
+        if response.status != 200:
+            disarm()
+            detail = response.read().decode(errors="replace")
+            connection.close()
+            raise OllamaError(f"Ollama returned HTTP {response.status}: {detail}")
+        return connection, response, disarm
+
+    def stream_generate(self, prompt, temperature=0.5, options=None, cancel=None):
+        """Yields response tokens as they arrive. If `cancel` (a CancelToken) fires,
+        the HTTP request is aborted and GenerationCancelled is raised."""
+        connection, response, disarm = self._post(self._payload(prompt, temperature, True, options), cancel)
+        try:
+            for line in response:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if "error" in message:
+                    raise OllamaError(message["error"])
+                if message.get("response"):
+                    yield message["response"]
+            if cancel is not None and cancel.cancelled:
+                raise GenerationCancelled(cancel.reason)
+        except (GenerationCancelled, GeneratorExit):
+            connection.close()
+            raise
+        except BaseException as e:
+            connection.close()
+            if cancel is not None and cancel.cancelled:
+                raise GenerationCancelled(cancel.reason) from e
+            raise
+        finally:
+            disarm()
+        self._release(connection, response)
+
+    def generate(self, prompt, temperature=0.5, options=None, cancel=None):
+        return "".join(self.stream_generate(prompt, temperature, options, cancel))
+
+    def warmup(self, background=True):
+        """Asks Ollama to load the model now, so the first real query doesn't pay for it.
+        An empty prompt loads the model without generating anything."""
+        def _warm():
+            try:
+                connection, response, _ = self._post(self._payload("", 0.0, False))
+                response.read()
+                self._release(connection, response)
+            except Exception as e:
+                print(f"⚠️ LLM warmup failed: {e}")
+
+        if not background:
+            _warm()
+            return None
+        self.warmup_thread = threading.Thread(target=_warm, name="llm-warmup", daemon=True)
+        self.warmup_thread.start()
+        return self.warmup_thread
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'requests': self.requests,
+                'connections_opened': self.connections_opened,
+                'idle_connections': self._idle.qsize(),
+                'last_request_overhead': self.last_request_overhead,
+            }
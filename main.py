@@ -1,9 +1,4 @@
-from langchain.llms import Ollama
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from sentence_transformers import SentenceTransformer
-import numpy as np
+import time
 # import chromadb
 from prompts import (
     CHAT_TEMPLATE, INITIAL_TEMPLATE, CORRECTION_CONTEXT,
@@ -11,15 +6,29 @@ from prompts import (
     GENERATION_CONTEXT, COMMENTING_CONTEXT, EXPLANATION_CONTEXT,
     LEETCODE_CONTEXT, SHORTENING_CONTEXT
 )
-import sqlite3
-from PyQt6.QtCore import QThread  
+from embedding_model import DEFAULT_MODEL_NAME, registry, embed_query
+from retrieval import EMBEDDINGS_DB, get_index
+from result_cache import RETRIEVAL_CACHE_DB, RetrievalCache, ResponseCache
+from llm_client import OllamaClient, GenerationCancelled
+from cancellation import CLOSED, CancelToken
+from history import HistoryManager
+from database import CONVERSATION_DB, ConversationStore
+from metrics import metrics, span
 
-def generate_embeddings(text, model_name="sentence-transformers/all-MiniLM-L6-v2"):
-    model = SentenceTransformer(model_name)
-    return model.encode([text])[0].tolist()  
+# Hard limits on a whole request, in seconds. Generation-heavy scenarios get longer.
+DEFAULT_REQUEST_TIMEOUT = 180
+SCENARIO_TIMEOUTS = {
+    "Code Completion": 90,
+    "Code Commenting": 120,
+    "Code Shortener": 120,
+    "Code Generation": 300,
+    "LeetCode Solver": 300,
+}
 
 class CodeBuddyConsole:
-    def __init__(self):
+    def __init__(self, retrieval_cache_path=RETRIEVAL_CACHE_DB, response_cache_threshold=None,
+                 embeddings_db=EMBEDDINGS_DB, conversation_db=CONVERSATION_DB, llm_client=None,
+                 nprobe=None, exact_search=False):
         self.current_state = {
             'chat_history': [],
             'initial_input': "",
@@ -32,6 +41,7 @@ class CodeBuddyConsole:
             'language': "Python",
             'scenario': "General Assistant",
             'temperature': 0.5,
+            'retrieval_mode': "hybrid",
             'libraries': []
         }
         
@@ -47,111 +57,193 @@ class CodeBuddyConsole:
             "Code Shortener": SHORTENING_CONTEXT
         }
         
+        self.scenario_timeouts = dict(SCENARIO_TIMEOUTS)
+
         self.languages = ['Python', 'GoLang', 'TypeScript', 'JavaScript', 
                           'Java', 'C', 'C++', 'C#', 'R', 'SQL']        
-    
-    def retrieve_relevant_docs(self, query, top_k=3, model_name="sentence-transformers/all-MiniLM-L6-v2"):
-        conn = sqlite3.connect("embeddings.db")
-        cursor = conn.cursor()
-
-        query_embedding = generate_embeddings(query, model_name)
-        query_embedding_array = np.array(query_embedding, dtype=np.float32)
-
-        cursor.execute('''
-            SELECT doc_id, chunk_id, chunk, embedding
-            FROM embeddings
-        ''')
 
-        results = []
-        for doc_id, chunk_id, chunk, embedding_blob in cursor.fetchall():
-            embedding = np.frombuffer(embedding_blob, dtype=np.float32)
-            similarity = np.dot(query_embedding_array, embedding) / (np.linalg.norm(query_embedding_array) * np.linalg.norm(embedding))
-            results.append((similarity, doc_id, chunk_id, chunk))
+        self.embeddings_db = embeddings_db
+        # Dense search settings: lists probed in the IVF sidecar (None uses the value
+        # calibrated when it was built), or a full scan that ignores the sidecar.
+        self.nprobe = nprobe
+        self.exact_search = exact_search
+        self.retrieval_cache = RetrievalCache(disk_path=retrieval_cache_path)
+        self.response_cache = ResponseCache(semantic_threshold=response_cache_threshold)
+        self.llm_client = llm_client or OllamaClient()
+        self.conversation_store = ConversationStore(conversation_db)
+        self.history_manager = HistoryManager(self.llm_client, self.conversation_store)
+    
+    def retrieve_relevant_docs(self, query, top_k=3, model_name=DEFAULT_MODEL_NAME, mode=None, embed=None):
+        """`embed(text)` overrides how the query is embedded, e.g. to reuse an
+        embedding that is already being computed."""
+        mode = mode or self.current_state['retrieval_mode']
+        embed = embed or (lambda text: embed_query(text, model_name))
+        index = get_index(self.embeddings_db)
+        search = "exact" if self.exact_search else self.nprobe
+        cache_key = self.retrieval_cache.key(
+            self.embeddings_db, query, top_k, mode, model_name, index.corpus_version(), search
+        )
+        results = self.retrieval_cache.get(cache_key)
+        if results is not None:
+            return results
 
-        results.sort(reverse=True, key=lambda x: x[0])
-        
-        return results[:top_k]
+        if mode == "hybrid":
+            results = index.hybrid_search(query, embed, top_k, exact=self.exact_search, nprobe=self.nprobe)
+        else:
+            results = index.search(embed(query), top_k, exact=self.exact_search, nprobe=self.nprobe)
+        self.retrieval_cache.put(cache_key, results)
+        return results
 
     def get_conversation_history(self, session_id):
-            conn = sqlite3.connect('conversation_history.db')
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT user_query, ai_response FROM conversations
-                WHERE session_id = ?
-                ORDER BY timestamp
-            ''', (session_id,))
-            history = cursor.fetchall()
-            conn.close()
-            return history
-
-    def process_query_stream(self, language, code, query, scenario, session_id):
+        return self.conversation_store.history(session_id)
+
+    def validate_scenario(self, scenario):
         if scenario not in self.scenario_map:
             raise ValueError(f"Invalid scenario. Choose from: {list(self.scenario_map.keys())}")
-        
-        self.current_state['scenario'] = scenario
-        self.current_state['scenario_context'] = self.scenario_map[scenario]
-        self.current_state['language'] = language
-
-        history = self.get_conversation_history(session_id)  
-        chat_history = self.format_conversation_history(history)
 
-        relevant_docs = self.retrieve_relevant_docs(query)
+    def build_prompt(self, language, code, query, scenario, history, summary, relevant_docs):
+        # Only reads shared state: one console serves concurrent requests (scheduler
+        # pool, server, batch), each with its own scenario and language.
+        chat_history = self.history_manager.format(history, summary)
         docs_text = "\n\n".join([doc[3] for doc in relevant_docs])
-        if not history:
-            prompt_template = PromptTemplate(
-                input_variables=['input', 'language', 'scenario', 'scenario_context', 'code_context', 'libraries', 'docs', 'chat_history'],
-                template=INITIAL_TEMPLATE
-            )
-        else:
-            prompt_template = PromptTemplate(
-                input_variables=['input', 'language', 'scenario', 'scenario_context', 'code_context', 'libraries', 'docs', 'chat_history', 'most_recent_ai_message', 'code_input'],
-                template=CHAT_TEMPLATE
-            )
-            most_recent_ai_message = history[-1][1] if history else ""
 
-        chain = self.create_llm_chain(prompt_template)
-        
+        prompt_variables = dict(
+            code_context=query,
+            language=language,
+            scenario=scenario,
+            scenario_context=self.scenario_map[scenario],
+            libraries=self.current_state['libraries'],
+            docs=docs_text,
+            chat_history=chat_history
+        )
         if not history:
-            response = chain.run(
-                input=code,
-                code_context=query,
-                language=self.current_state['language'],
-                scenario=self.current_state['scenario'],
-                scenario_context=self.current_state['scenario_context'],
-                libraries=self.current_state['libraries'],
-                docs=docs_text,
-                chat_history=chat_history
-            )
-        else:
-            response = chain.run(
-                input=query, 
-                code_context=query,  
-                language=self.current_state['language'],
-                scenario=self.current_state['scenario'],
-                scenario_context=self.current_state['scenario_context'],
-                libraries=self.current_state['libraries'],
-                docs=docs_text,
-                chat_history=chat_history,
-                most_recent_ai_message=most_recent_ai_message,
-                code_input=code  
-            )
-        
-        conn = sqlite3.connect('conversation_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO conversations (session_id, user_query, ai_response)
-            VALUES (?, ?, ?)
-        ''', (session_id, query, response))
-        conn.commit()
-        conn.close()
-
-        formatted_response = "\n".join(line for line in response.splitlines() if line.strip())
-        yield formatted_response
+            return INITIAL_TEMPLATE.format(input=code, **prompt_variables)
+        return CHAT_TEMPLATE.format(
+            input=query,
+            most_recent_ai_message=history[-1][1],
+            code_input=code,
+            **prompt_variables
+        )
+
+    def start_cancel_token(self, scenario, cancel=None):
+        cancel = cancel or CancelToken()
+        cancel.set_timeout(self.scenario_timeouts.get(scenario, DEFAULT_REQUEST_TIMEOUT))
+        return cancel
+
+    def record_response(self, session_id, query, response, cache_key, query_embedding, cancelled=None):
+        """Caches a complete answer and queues the turn for the history. A cancelled
+        answer is only saved to the history, and only if something was generated."""
+        if response and not cancelled:
+            self.response_cache.put(cache_key, response, query_embedding)
+        # Written behind by the store's background writer; the answer is already on screen.
+        if response or not cancelled:
+            self.conversation_store.queue_turn(session_id, query, response)
+
+    def note_model_load(self, timings, was_loaded, model_name=DEFAULT_MODEL_NAME):
+        """If the embedding model was loaded during this request, moves the load time
+        out of timings['embedding'] into timings['model_load']."""
+        if was_loaded or not registry.is_loaded(model_name):
+            return
+        load_time = registry.load_seconds.get(model_name, 0.0)
+        timings['model_load'] = load_time
+        timings['embedding'] = max(timings.get('embedding', 0.0) - load_time, 0.0)
+
+    def timed_retrieval(self, query, timings):
+        """retrieve_relevant_docs with its time split between timings['embedding']
+        and timings['retrieval'] (the corpus scan)."""
+        def embed(text):
+            with span(timings, 'embedding'):
+                return embed_query(text)
+
+        embedding_before = timings.get('embedding', 0.0)
+        with span(timings, 'retrieval'):
+            results = self.retrieve_relevant_docs(query, embed=embed)
+        timings['retrieval'] -= timings.get('embedding', 0.0) - embedding_before
+        return results
+
+    def process_query_stream(self, language, code, query, scenario, session_id, meta=None, cancel=None):
+        """Yields the response as Ollama streams it. If `meta` is a dict it is filled
+        with 'time_to_first_token' and 'total_time' in seconds, with 'timings' (seconds
+        per stage, also recorded to the metrics store) and with 'cached' ('exact' or
+        'semantic') when the answer came from the response cache.
+
+        The request is aborted when `cancel` (a CancelToken) fires or the scenario's
+        timeout runs out. The partial answer is then saved to the history and
+        meta['cancelled'] is set to the reason."""
+        started_at = time.perf_counter()
+        self.validate_scenario(scenario)
+        timings = meta.setdefault('timings', {}) if meta is not None else {}
+        was_loaded = registry.is_loaded()
+
+        cache_key = self.response_cache.key(scenario, language, code, query, self.llm_client.model)
+        query_embedding = None
+        if self.response_cache.semantic_threshold is not None:
+            with span(timings, 'embedding'):
+                query_embedding = embed_query(query)
+        cached = self.response_cache.get(cache_key, query_embedding)
+        if cached is not None:
+            response, tier = cached
+            if meta is not None:
+                meta['cached'] = tier
+                meta['time_to_first_token'] = time.perf_counter() - started_at
+            yield response
+            self.conversation_store.queue_turn(session_id, query, response)
+            self.note_model_load(timings, was_loaded)
+            metrics.record("assist", timings, "cached", time.perf_counter() - started_at)
+            if meta is not None:
+                meta['total_time'] = time.perf_counter() - started_at
+            return
+
+        cancel = self.start_cancel_token(scenario, cancel)
+        response_parts = []
+        cancelled = None
+        outcome = "error"
+        try:
+            with span(timings, 'history'):
+                history, summary = self.history_manager.context(session_id)
+            relevant_docs = self.timed_retrieval(query, timings)
+            self.note_model_load(timings, was_loaded)
+            with span(timings, 'prompt'):
+                prompt = self.build_prompt(language, code, query, scenario, history, summary, relevant_docs)
+
+            # 'first_token' is the wait for Ollama (model load, prompt evaluation),
+            # 'generation' the streaming after it.
+            requested_at = first_token_at = time.perf_counter()
+            try:
+                for token in self.llm_client.stream_generate(
+                    prompt, temperature=self.current_state['temperature'], cancel=cancel
+                ):
+                    if not response_parts:
+                        first_token_at = time.perf_counter()
+                        timings['first_token'] = first_token_at - requested_at
+                        if meta is not None:
+                            meta['time_to_first_token'] = first_token_at - started_at
+                    response_parts.append(token)
+                    yield token
+            except GenerationCancelled as e:
+                cancelled = e.reason
+                if meta is not None:
+                    meta['cancelled'] = cancelled
+            timings['generation'] = time.perf_counter() - first_token_at
+            outcome = cancelled or "ok"
+        except GeneratorExit:
+            # The caller stopped reading; what it already showed still belongs in the history.
+            outcome = CLOSED
+            self.record_response(session_id, query, "".join(response_parts), cache_key, query_embedding, CLOSED)
+            raise
+        finally:
+            cancel.close()
+            metrics.record("assist", timings, outcome, time.perf_counter() - started_at)
+        self.record_response(session_id, query, "".join(response_parts), cache_key, query_embedding, cancelled)
+
+        if meta is not None:
+            meta['total_time'] = time.perf_counter() - started_at
     
     def format_conversation_history(self, history):
         return "\n".join([f"User: {q}\nAI: {a}" for q, a in history])
 
-    def create_llm_chain(self, prompt_template):
-        memory = ConversationBufferMemory(input_key="input", memory_key="chat_history")
-        llm = Ollama(model="qwen2.5-coder:7b", temperature=self.current_state['temperature'])
-        return LLMChain(llm=llm, prompt=prompt_template, memory=memory)
\ No newline at end of file
+    def close(self):
+        """Commits queued conversation turns and releases connections."""
+        self.conversation_store.close()
+        self.retrieval_cache.close()
+        self.llm_client.close()
@@ -0,0 +1,135 @@
+import os
+import time
+import bisect
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# In-process latency histograms for Assist requests and code runs, exported in the
+# Prometheus text format: GET /metrics on server.py, or a file rewritten after every
+# request when CODEBUDDY_METRICS_FILE is set (for node_exporter's textfile collector).
+
+METRICS_FILE_ENV = "CODEBUDDY_METRICS_FILE"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Stages in the order they run, for display.
+STAGE_ORDER = (
+    "queue_wait", "model_load", "history", "embedding", "retrieval", "prompt", "first_token",
+    "generation", "compile", "run",
+)
+
+
+@contextmanager
+def span(timings, stage):
+    """Adds the seconds spent in the block to timings[stage]."""
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started_at
+
+
+def format_timings(timings):
+    """'history 0.01s, retrieval 0.20s, ...' in pipeline order."""
+    def order(stage):
+        return STAGE_ORDER.index(stage) if stage in STAGE_ORDER else len(STAGE_ORDER)
+
+    return ", ".join(
+        f"{stage.replace('_', ' ')} {timings[stage]:.2f}s" for stage in sorted(timings, key=order)
+    )
+
+
+class _Histogram:
+    def __init__(self, bucket_count):
+        # Per-bucket (not cumulative) counts; the last slot is +Inf.
+        self.counts = [0] * (bucket_count + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+class MetricsStore:
+    """Thread-safe stage histograms and request counters, labelled by pipeline
+    ('assist', 'compile_run') and stage. Also keeps each pipeline's last breakdown."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, export_path=None):
+        self.buckets = tuple(buckets)
+        self.export_path = export_path
+        self._stages = {}
+        self._requests = Counter()
+        self._last = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _observe(self, pipeline, stage, seconds):
+        histogram = self._stages.get((pipeline, stage))
+        if histogram is None:
+            histogram = self._stages[(pipeline, stage)] = _Histogram(len(self.buckets))
+        histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        histogram.count += 1
+        histogram.sum += seconds
+
+    def observe(self, pipeline, stage, seconds):
+        with self._lock:
+            self._observe(pipeline, stage, seconds)
+        self._export()
+
+    def record(self, pipeline, timings, outcome="ok", total=None):
+        """Records one request: each stage in `timings` (seconds), the outcome, and
+        the end-to-end time as stage 'total'."""
+        with self._lock:
+            for stage, seconds in timings.items():
+                self._observe(pipeline, stage, seconds)
+            if total is not None:
+                self._observe(pipeline, "total", total)
+            self._requests[(pipeline, outcome)] += 1
+            self._last[pipeline] = {'timings': dict(timings), 'outcome': outcome, 'total': total}
+        self._export()
+
+    def last(self, pipeline):
+        with self._lock:
+            return dict(self._last.get(pipeline, {}))
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+            self._requests.clear()
+            self._last.clear()
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP codebuddy_stage_seconds Time spent in each stage of a request.",
+            "# TYPE codebuddy_stage_seconds histogram",
+        ]
+        with self._lock:
+            for (pipeline, stage), histogram in sorted(self._stages.items()):
+                labels = f'pipeline="{pipeline}",stage="{stage}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    le = bound if isinstance(bound, str) else f"{bound:g}"
+                    lines.append(f'codebuddy_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"codebuddy_stage_seconds_sum{{{labels}}} {histogram.sum:.6f}")
+                lines.append(f"codebuddy_stage_seconds_count{{{labels}}} {histogram.count}")
+            lines.append("# HELP codebuddy_requests_total Requests by pipeline and outcome.")
+            lines.append("# TYPE codebuddy_requests_total counter")
+            for (pipeline, outcome), count in sorted(self._requests.items()):
+                lines.append(f'codebuddy_requests_total{{pipeline="{pipeline}",outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Written aside and renamed, so a scraper never reads half a file.
+        with self._write_lock:
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(temp_path, path)
+
+    def _export(self):
+        if not self.export_path:
+            return
+        try:
+            self.write(self.export_path)
+        except OSError as e:
+            print(f"⚠️ Could not write metrics to {self.export_path}: {e}")
+
+
+metrics = MetricsStore(export_path=os.environ.get(METRICS_FILE_ENV))
@@ -35,6 +35,16 @@ CHAT_TEMPLATE = '''
     \nBe sure to end your response by asking the user if they need any further assistance.
     \n\nAI {language} CHATBOT RESPONSE HERE:\n
 '''
+SUMMARY_TEMPLATE = '''
+    Summarize the earlier part of a conversation between a user and an AI coding assistant.
+    \nKeep the facts, code decisions and open questions needed to continue the conversation; drop pleasantries.
+    \nUse at most {max_words} words.
+    \nSUMMARY SO FAR:
+    \n{summary}
+    \nNEW TURNS TO FOLD IN:
+    \n{turns}
+    \n\nUPDATED SUMMARY:\n
+'''
 # Scenario Contexts
 
 GENERAL_ASSISTANT_CONTEXT = '''
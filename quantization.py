@@ -0,0 +1,45 @@
+import numpy as np
+
+NO_QUANTIZATION = "none"
+FLOAT16 = "float16"
+INT8 = "int8"
+MODES = (NO_QUANTIZATION, FLOAT16, INT8)
+
+CODE_DTYPES = {
+    NO_QUANTIZATION: np.float32,
+    FLOAT16: np.float16,
+    INT8: np.int8,
+}
+
+SCORE_BLOCK_ROWS = 16384
+DEFAULT_RESCORE_K = 200
+
+
+def quantize(matrix, mode):
+    """Returns (codes, scales) for a batch of unit-length float32 vectors. Only int8
+    uses per-vector scales; the other modes return None for them."""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if mode == NO_QUANTIZATION:
+        return matrix, None
+    if mode == FLOAT16:
+        return matrix.astype(np.float16), None
+    if mode == INT8:
+        scales = np.abs(matrix).max(axis=1) / 127.0 if len(matrix) else np.empty(0, dtype=np.float32)
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization mode '{mode}'. Choose from: {list(MODES)}")
+
+
+def score(codes, query, scales=None, rows=None):
+    """Dot products of `query` with `codes` (or with `codes[rows]`). Works in blocks
+    so only one block at a time is widened to float32."""
+    n_rows = len(codes) if rows is None else len(rows)
+    scores = np.empty(n_rows, dtype=np.float32)
+    for start in range(0, n_rows, SCORE_BLOCK_ROWS):
+        end = min(start + SCORE_BLOCK_ROWS, n_rows)
+        block_rows = slice(start, end) if rows is None else rows[start:end]
+        scores[start:end] = np.asarray(codes[block_rows], dtype=np.float32) @ query
+        if scales is not None:
+            scores[start:end] *= scales[block_rows]
+    return scores
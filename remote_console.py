@@ -0,0 +1,97 @@
+import json
+import http.client
+from urllib.parse import urlsplit
+from llm_client import abort_connection
+
+# When set, the IDE sends Assist requests to a CodeBuddy server (server.py)
+# instead of loading the models in-process.
+SERVER_URL_ENV = "CODEBUDDY_SERVER_URL"
+DEFAULT_TIMEOUT = 600
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RemoteCodeBuddyConsole:
+    """Client for server.py with the same `process_query_stream` as CodeBuddyConsole,
+    so the IDE's scheduler and AIRequest can use a shared server transparently."""
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT):
+        if "://" not in base_url:
+            base_url = "http://" + base_url
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.scheme = parts.scheme or "http"
+        self.timeout = timeout
+
+    def _connection(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _get(self, path):
+        connection = self._connection()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            payload = json.loads(response.read() or b"{}")
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise RemoteError(payload.get("error", f"HTTP {response.status}"))
+        return payload
+
+    def health(self):
+        return self._get("/health")
+
+    def stats(self):
+        return self._get("/stats")
+
+    def process_query_stream(self, language, code, query, scenario, session_id, meta=None, cancel=None):
+        """Yields the server's streamed tokens. The server's meta is copied into
+        `meta` at the end. If `cancel` fires, the connection is dropped, which makes
+        the server abort the generation."""
+        body = json.dumps({
+            "language": language, "code": code, "query": query,
+            "scenario": scenario, "session_id": session_id, "stream": True,
+        }).encode("utf-8")
+        connection = self._connection()
+        disarm = cancel.on_cancel(lambda reason: abort_connection(connection)) if cancel is not None else (lambda: None)
+        try:
+            connection.request("POST", "/api/query", body=body, headers={"Content-Type": "application/json"})
+            response = connection.getresponse()
+            if response.status == 400:
+                raise ValueError(json.loads(response.read() or b"{}").get("error", "Bad request"))
+            if response.status != 200:
+                raise RemoteError(f"CodeBuddy server returned HTTP {response.status}")
+            for line in response:
+                if not line.strip():
+                    continue
+                message = json.loads(line)
+                if "token" in message:
+                    yield message["token"]
+                elif "error" in message:
+                    raise RemoteError(message["error"])
+                elif message.get("done"):
+                    if meta is not None:
+                        meta.update(message.get("meta", {}))
+                    return
+            raise RemoteError("CodeBuddy server closed the stream early")
+        except GeneratorExit:
+            raise
+        except Exception as e:
+            if cancel is not None and cancel.cancelled:
+                if meta is not None:
+                    meta['cancelled'] = cancel.reason
+                return
+            if isinstance(e, (ValueError, RemoteError)):
+                raise
+            raise RemoteError(f"Request to the CodeBuddy server at {self.base_url} failed: {e}") from e
+        finally:
+            disarm()
+            connection.close()
+
+    def close(self):
+        pass
@@ -0,0 +1,246 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+RETRIEVAL_CACHE_DB = "retrieval_cache.db"
+DEFAULT_RESPONSE_TTL = 24 * 60 * 60
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class RetrievalCache:
+    """Retrieval results keyed by (embeddings database, normalized query, top_k,
+    mode, model, dense search setting, corpus version). A bounded in-memory LRU sits
+    in front of an optional SQLite tier that survives restarts and may be shared by
+    consoles on different databases. Ingestion bumps the corpus version, so stale
+    entries are never served; the disk tier drops a database's stale entries the
+    next time it writes one for that database."""
+
+    def __init__(self, max_entries=256, disk_path=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_versions = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            columns = [row[1] for row in self._disk.execute("PRAGMA table_info(retrieval_cache)")]
+            if columns and "db_path" not in columns:
+                # Entries from before keys named their database can't be attributed.
+                self._disk.execute("DROP TABLE retrieval_cache")
+            self._disk.execute('''
+                CREATE TABLE IF NOT EXISTS retrieval_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    db_path TEXT,
+                    corpus_version INTEGER,
+                    results TEXT,
+                    last_used REAL
+                )
+            ''')
+            self._disk.execute(
+                "CREATE INDEX IF NOT EXISTS idx_retrieval_cache_last_used ON retrieval_cache (last_used)"
+            )
+            self._disk.commit()
+
+    @staticmethod
+    def key(db_path, query, top_k, mode, model_name, corpus_version, search=None):
+        """`search` is the dense search setting ('exact', an nprobe, or None for the
+        sidecar's default). The database comes first and the corpus version last;
+        `put` reads them from there."""
+        return (os.path.realpath(db_path), normalize_query(query), top_k, mode, model_name, search, corpus_version)
+
+    def get(self, key):
+        with self._lock:
+            results = self._memory.get(key)
+            if results is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return results
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT results FROM retrieval_cache WHERE cache_key = ?", (json.dumps(key),)
+                ).fetchone()
+                if row is not None:
+                    self._disk.execute(
+                        "UPDATE retrieval_cache SET last_used = ? WHERE cache_key = ?",
+                        (time.time(), json.dumps(key))
+                    )
+                    self._disk.commit()
+                    results = [tuple(result) for result in json.loads(row[0])]
+                    self._remember(key, results)
+                    self.disk_hits += 1
+                    return results
+
+            self.misses += 1
+            return None
+
+    def put(self, key, results):
+        results = [tuple(result) for result in results]
+        with self._lock:
+            self._remember(key, results)
+            if self._disk is None:
+                return
+
+            db_path, corpus_version = key[0], key[-1]
+            with self._disk:
+                if corpus_version != self._disk_versions.get(db_path):
+                    self._disk.execute(
+                        "DELETE FROM retrieval_cache WHERE db_path = ? AND corpus_version != ?",
+                        (db_path, corpus_version)
+                    )
+                    self._disk_versions[db_path] = corpus_version
+                self._disk.execute('''
+                    INSERT OR REPLACE INTO retrieval_cache (cache_key, db_path, corpus_version, results, last_used)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (json.dumps(key), db_path, corpus_version, json.dumps(results), time.time()))
+                self._disk.execute('''
+                    DELETE FROM retrieval_cache WHERE cache_key IN (
+                        SELECT cache_key FROM retrieval_cache
+                        ORDER BY last_used DESC
+                        LIMIT -1 OFFSET ?
+                    )
+                ''', (self.max_disk_entries,))
+
+    def _remember(self, key, results):
+        self._memory[key] = results
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                with self._disk:
+                    self._disk.execute("DELETE FROM retrieval_cache")
+
+    def stats(self):
+        with self._lock:
+            disk_entries = 0
+            if self._disk is not None:
+                disk_entries = self._disk.execute("SELECT COUNT(*) FROM retrieval_cache").fetchone()[0]
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'disk_entries': disk_entries,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+
+class ResponseCache:
+    """LLM answers keyed by (scenario, language, code hash, normalized query, model).
+
+    The exact tier only matches the same request. If `semantic_threshold` is set,
+    a miss falls back to the semantic tier: an answer for the same scenario,
+    language, code and model is reused when its query embedding has cosine
+    similarity >= the threshold with this one. Entries expire after `ttl` seconds
+    and the least recently used are evicted beyond `max_entries`."""
+
+    def __init__(self, max_entries=256, ttl=DEFAULT_RESPONSE_TTL, semantic_threshold=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(scenario, language, code, query, model_name):
+        code_hash = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        return (scenario, language, code_hash, model_name, normalize_query(query))
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry['created_at'] > self.ttl
+
+    def get(self, key, embedding=None, count_miss=True):
+        """Returns (response, tier) with tier 'exact' or 'semantic', or None on a miss.
+
+        Pass count_miss=False for an early exact-only check that is followed by a
+        full lookup, so the miss isn't counted twice."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry['response'], 'exact'
+
+            if self.semantic_threshold is not None and embedding is not None:
+                query_vector = _unit(embedding)
+                best_key, best_score = None, self.semantic_threshold
+                for other_key, other in list(self._entries.items()):
+                    if other_key[:4] != key[:4] or other['embedding'] is None:
+                        continue
+                    if self._expired(other, now):
+                        del self._entries[other_key]
+                        continue
+                    similarity = float(np.dot(query_vector, other['embedding']))
+                    if similarity >= best_score:
+                        best_key, best_score = other_key, similarity
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.semantic_hits += 1
+                    return self._entries[best_key]['response'], 'semantic'
+
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def put(self, key, response, embedding=None):
+        with self._lock:
+            self._entries[key] = {
+                'response': response,
+                'embedding': _unit(embedding) if embedding is not None else None,
+                'created_at': time.time(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+            }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else vector
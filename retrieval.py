@@ -0,0 +1,247 @@
+import os
+import sqlite3
+import threading
+import numpy as np
+import lexical_index
+from ann_index import IVFIndex, sidecar_path
+from quantization import DEFAULT_RESCORE_K, score
+from vector_store import get_corpus_version, get_quantization, open_store
+
+EMBEDDINGS_DB = "embeddings.db"
+DEFAULT_FUSION_CANDIDATES = 50
+RRF_K = 60
+
+
+def _top_k(scores, k):
+    k = min(k, len(scores))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class VectorIndex:
+    """Resident, pre-normalized embedding matrix for fast cosine search. The matrix
+    comes from the database's vector store: a copy for SQLite BLOB storage, or a
+    zero-copy np.memmap for the memmap store.
+
+    When an IVF sidecar has been built next to the database, queries only score
+    the candidates from the probed lists; `exact=True` forces a full scan. `nprobe`
+    defaults to the value calibrated into the sidecar when it was built. When
+    the database stores quantized vectors, the scan runs on those and the best
+    `rescore_k` candidates are rescored in full precision."""
+
+    def __init__(self, db_path=EMBEDDINGS_DB, nprobe=None, rescore_k=DEFAULT_RESCORE_K):
+        self.db_path = db_path
+        self.nprobe = nprobe
+        self.rescore_k = rescore_k
+        self._ann = None
+        self._ann_mtime = None
+        self._lock = threading.Lock()
+        self._conn = None
+        self._store = None
+        self._data_version = None
+        self._signature = None
+        self._rowids = np.empty(0, dtype=np.int64)
+        self._matrix = np.empty((0, 0), dtype=np.float32)
+        self._positions = None
+        self._scales = None
+        self._has_fts = False
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def _table_signature(self, conn):
+        signature = self._store.signature(conn)
+        if signature is None:
+            return None
+        return (self._store.kind,) + signature + (get_quantization(conn), get_corpus_version(conn))
+
+    def _refresh_ann(self):
+        path = sidecar_path(self.db_path)
+        mtime = os.path.getmtime(path) if os.path.exists(path) else None
+        if mtime == self._ann_mtime:
+            return
+        self._ann_mtime = mtime
+        self._ann = IVFIndex.load(path) if mtime is not None else None
+
+    def _refresh(self):
+        self._refresh_ann()
+        conn = self._connection()
+        # data_version only moves when another connection commits, so the common
+        # case costs a single pragma instead of a table scan.
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version and self._signature is not None:
+            return
+        self._data_version = data_version
+
+        self._store = open_store(conn, self.db_path)
+        self._has_fts = lexical_index.fts_table_exists(conn)
+        signature = self._table_signature(conn)
+        if signature == self._signature:
+            return
+        self._signature = signature
+        self._load(conn, signature)
+
+    def _load(self, conn, signature):
+        if signature is None or not signature[1]:
+            self._rowids = np.empty(0, dtype=np.int64)
+            self._matrix = np.empty((0, 0), dtype=np.float32)
+            self._positions = None
+            self._scales = None
+            return
+        self._rowids, self._matrix, self._positions, self._scales = self._store.load(conn)
+
+    def reload(self):
+        with self._lock:
+            self._signature = None
+            self._data_version = None
+            self._ann_mtime = None
+            self._refresh()
+
+    def __len__(self):
+        return len(self._rowids)
+
+    def corpus_version(self):
+        """The version stamp ingestion bumps on every write, or 0 for an empty or
+        legacy database."""
+        with self._lock:
+            self._refresh()
+            return self._signature[-1] if self._signature else 0
+
+    def _ann_candidates(self, ann, rowids, query, nprobe):
+        candidates = ann.candidates(query, nprobe)
+        indices = np.minimum(np.searchsorted(rowids, candidates), len(rowids) - 1)
+        indices = indices[rowids[indices] == candidates]
+
+        # Rows ingested after the sidecar was last updated are always scored exactly.
+        tail_start = np.searchsorted(rowids, ann.max_rowid, side="right")
+        return np.concatenate((indices, np.arange(tail_start, len(rowids))))
+
+    def search(self, query_embedding, top_k=3, exact=False, nprobe=None, rescore_k=None):
+        rowids, scores = self.dense_candidates(query_embedding, top_k, exact, nprobe, rescore_k)
+        return self.fetch_chunks(rowids, scores)
+
+    def dense_candidates(self, query_embedding, top_k=3, exact=False, nprobe=None, rescore_k=None):
+        """Returns (rowids, cosine scores) of the best `top_k` chunks, best first."""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            matrix, rowids, positions, scales, ann = (
+                self._matrix, self._rowids, self._positions, self._scales, self._ann
+            )
+
+        if not len(rowids) or top_k <= 0:
+            return empty
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return empty
+        query = query / query_norm
+
+        # `indices` point into `rowids`; `positions` (if any) map those to matrix rows.
+        indices = None
+        if ann is not None and not exact:
+            nprobe = nprobe or self.nprobe or ann.nprobe
+            # Probing every list would only add the candidate lookup to a full scan.
+            if nprobe < ann.nlist:
+                indices = self._ann_candidates(ann, rowids, query, nprobe)
+                if len(indices) < top_k:
+                    indices = None
+
+        if indices is None:
+            rows = positions
+        else:
+            rows = indices if positions is None else positions[indices]
+        scores = score(matrix, query, scales, rows)
+
+        if matrix.dtype == np.float32:
+            top = _top_k(scores, top_k)
+            top_indices = top if indices is None else indices[top]
+            return rowids[top_indices], scores[top]
+
+        # Quantized scores only shortlist candidates; the final order comes from
+        # rescoring the shortlist against the full-precision vectors.
+        shortlist = _top_k(scores, max(top_k, rescore_k or self.rescore_k))
+        shortlist_rowids = rowids[shortlist if indices is None else indices[shortlist]]
+        with self._lock:
+            exact_vectors = self._store.exact_vectors(
+                self._connection(), [int(rowid) for rowid in shortlist_rowids]
+            )
+        exact_scores = exact_vectors @ query
+        top = _top_k(exact_scores, top_k)
+        return shortlist_rowids[top], exact_scores[top]
+
+    def lexical_candidates(self, query_text, limit, require_all=False):
+        """Returns [(rowid, bm25)] from the FTS5 mirror, best first; empty when the
+        database has no FTS table."""
+        with self._lock:
+            self._refresh()
+            if not self._has_fts:
+                return []
+            return lexical_index.search(self._connection(), query_text, limit, require_all)
+
+    def hybrid_search(self, query_text, embed, top_k=3, candidates=DEFAULT_FUSION_CANDIDATES,
+                      rrf_k=RRF_K, lexical_shortcut=True, exact=False, nprobe=None):
+        """Fuses BM25 and dense rankings with reciprocal rank fusion. `embed` maps the
+        query text to its embedding and is only called when the dense side is needed:
+        an identifier-like query whose terms all match at least `top_k` chunks is
+        answered from FTS alone.
+
+        Scores are always RRF scores, sum(1 / (rrf_k + rank)) over the rankings a
+        chunk appears in, so at most 2 / (rrf_k + 1). FTS-only answers are scored as
+        a single BM25 ranking. They are comparable with each other, not with the
+        cosine similarities `search` returns."""
+        if lexical_shortcut and lexical_index.is_identifier_query(query_text):
+            strong_hits = self.lexical_candidates(query_text, top_k, require_all=True)
+            if len(strong_hits) >= top_k:
+                return self.fetch_chunks(
+                    [rowid for rowid, _ in strong_hits],
+                    [1.0 / (rrf_k + rank + 1) for rank in range(len(strong_hits))]
+                )
+
+        lexical_hits = self.lexical_candidates(query_text, candidates)
+        dense_rowids, _ = self.dense_candidates(embed(query_text), candidates, exact, nprobe)
+
+        fused = {}
+        for rank, rowid in enumerate(rowid for rowid, _ in lexical_hits):
+            fused[rowid] = fused.get(rowid, 0.0) + 1.0 / (rrf_k + rank + 1)
+        for rank, rowid in enumerate(dense_rowids.tolist()):
+            fused[rowid] = fused.get(rowid, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+        best = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return self.fetch_chunks([rowid for rowid, _ in best], [value for _, value in best])
+
+    def fetch_chunks(self, rowids, scores):
+        rowids = [int(rowid) for rowid in rowids]
+        if not rowids:
+            return []
+        with self._lock:
+            by_rowid = self._store.fetch_chunks(self._connection(), rowids)
+
+        results = []
+        for rowid, similarity in zip(rowids, scores):
+            if rowid in by_rowid:
+                doc_id, chunk_id, chunk = by_rowid[rowid]
+                results.append((float(similarity), doc_id, chunk_id, chunk))
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(db_path=EMBEDDINGS_DB):
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            index = VectorIndex(db_path)
+            _indexes[db_path] = index
+        return index
@@ -0,0 +1,226 @@
+import os
+import threading
+from collections import deque
+from cancellation import CancelToken, CANCELLED
+
+# Ollama serves this many generations of one model at a time; more workers than
+# that only queue inside Ollama, where they can no longer be superseded.
+DEFAULT_MAX_WORKERS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "1"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SUPERSEDED = "superseded"
+
+
+class Job:
+    """One scheduled generation and everyone waiting on it.
+
+    `stream_factory(meta, cancel)` is called with the job's meta dict and CancelToken.
+    Listeners are objects with on_chunk(text), on_finished(meta), on_error(exc) and
+    on_superseded() methods. They are called from the worker thread. A listener that
+    subscribes while the job is running first receives everything streamed so far
+    as a single chunk."""
+
+    def __init__(self, key, lane, stream_factory):
+        self.key = key
+        self.lane = lane
+        self.stream_factory = stream_factory
+        self.state = QUEUED
+        self.meta = {}
+        self.chunks = []
+        self.error = None
+        self.cancel_token = CancelToken()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def subscribe(self, listener):
+        with self._lock:
+            if self.chunks:
+                listener.on_chunk("".join(self.chunks))
+            if self.state == DONE:
+                listener.on_finished(dict(self.meta))
+            elif self.state == FAILED:
+                listener.on_error(self.error)
+            elif self.state == SUPERSEDED:
+                listener.on_superseded()
+            else:
+                self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        """Stops sending events to `listener`; returns how many listeners are left."""
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+            return len(self._listeners)
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def _supersede(self):
+        with self._lock:
+            if self.state != QUEUED:
+                return False
+            self.state = SUPERSEDED
+            listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            listener.on_superseded()
+        self._done.set()
+        return True
+
+    def _run(self):
+        with self._lock:
+            if self.state != QUEUED:
+                return
+            self.state = RUNNING
+        try:
+            for chunk in self.stream_factory(self.meta, self.cancel_token):
+                with self._lock:
+                    self.chunks.append(chunk)
+                    for listener in self._listeners:
+                        listener.on_chunk(chunk)
+        except Exception as e:
+            with self._lock:
+                self.state, self.error = FAILED, e
+                listeners, self._listeners = self._listeners, []
+            for listener in listeners:
+                listener.on_error(e)
+            self._done.set()
+        else:
+            self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self.state = DONE
+            listeners, self._listeners = self._listeners, []
+        for listener in listeners:
+            listener.on_finished(dict(self.meta))
+        self._done.set()
+
+
+class RequestScheduler:
+    """Runs AI requests on a fixed pool of worker threads.
+
+    - At most `max_workers` requests run at once; the rest wait in FIFO order.
+    - Submitting a request whose key matches one that is queued or running attaches
+      to that job instead of starting another generation.
+    - Submitting a request in a lane (one per editor tab) supersedes the lane's
+      requests that are still queued; requests already running are left alone."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS):
+        self.max_workers = max(1, max_workers)
+        self._queue = deque()
+        self._in_flight = {}
+        self._running = set()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.superseded = 0
+        self._threads = [
+            threading.Thread(target=self._work, name=f"ai-request-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, key, lane, stream_factory, listener=None):
+        """Schedules `stream_factory(meta, cancel)`, a callable returning an iterable
+        of text chunks, and returns its Job."""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("RequestScheduler is closed")
+            self.submitted += 1
+            job = self._in_flight.get(key)
+            if job is not None and not job.finished:
+                self.coalesced += 1
+            else:
+                job = Job(key, lane, stream_factory)
+                self._in_flight[key] = job
+                self._queue.append(job)
+                self._cond.notify()
+            # Taken off the queue under the lock, so no worker can start them meanwhile.
+            stale = [queued for queued in self._queue if queued.lane == lane and queued is not job]
+            for queued in stale:
+                self._queue.remove(queued)
+                del self._in_flight[queued.key]
+            self.superseded += len(stale)
+            # Subscribed under the lock, so `detach` can't cancel the job in between.
+            if listener is not None:
+                job.subscribe(listener)
+        for queued in stale:
+            queued._supersede()
+        return job
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                job = self._queue.popleft()
+                self._running.add(job)
+            job._run()
+            with self._cond:
+                self._running.discard(job)
+                if self._in_flight.get(job.key) is job:
+                    del self._in_flight[job.key]
+
+    def cancel(self, job, reason=CANCELLED):
+        """Stops a job. A queued job finishes at once with meta['cancelled'] set; a
+        running one has its CancelToken fired, which aborts its HTTP request."""
+        with self._cond:
+            queued = job in self._queue
+            if queued:
+                self._queue.remove(job)
+            # A request submitted from now on starts afresh instead of joining this one.
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+        job.cancel_token.cancel(reason)
+        if queued:
+            job.meta['cancelled'] = reason
+            job._finish()
+
+    def detach(self, job, listener, reason=CANCELLED):
+        """Detaches one listener from a job that others may share, and cancels the job
+        once nobody is listening to it. Returns True if it was cancelled."""
+        with self._cond:
+            if job.unsubscribe(listener):
+                return False
+            self.cancel(job, reason)
+            return True
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': self.max_workers,
+                'queued': len(self._queue),
+                'running': len(self._running),
+                'in_flight': len(self._in_flight),
+                'submitted': self.submitted,
+                'coalesced': self.coalesced,
+                'superseded': self.superseded,
+            }
+
+    def close(self, wait=True):
+        """Supersedes everything still queued, cancels the running requests and stops
+        the workers."""
+        with self._cond:
+            self._closed = True
+            queued, self._queue = list(self._queue), deque()
+            running = list(self._running)
+            self._cond.notify_all()
+        for job in queued:
+            job._supersede()
+        for job in running:
+            job.cancel_token.cancel(CANCELLED)
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,264 @@
+import json
+import socket
+import time
+import queue
+import select
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from main import CodeBuddyConsole
+from async_console import AsyncCodeBuddyConsole, AsyncConsoleBridge
+from scheduler import RequestScheduler, DEFAULT_MAX_WORKERS
+from embedding_model import registry, warmup as warmup_embedding_model
+from metrics import metrics
+
+# Headless CodeBuddy: one warm process (embedding model, retrieval index, Ollama
+# client) shared by any number of IDEs and scripts over local HTTP/JSON.
+#
+#   POST /api/query  {"language", "code", "query", "scenario", "session_id", "stream"}
+#       stream=true (default) answers with NDJSON lines {"token": ...}, ending with
+#       {"done": true, "meta": {...}} or {"error": ...}; stream=false answers with
+#       a single {"response": ..., "meta": {...}} object.
+#   GET /health      liveness, model and warmup state
+#   GET /stats       scheduler, LLM client and cache counters
+#   GET /metrics     per-stage latency histograms in the Prometheus text format
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+REQUIRED_FIELDS = ("language", "query", "scenario", "session_id")
+# How often a handler waiting on its job checks whether the client hung up.
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class _QueueListener:
+    """Scheduler listener that hands a job's events to the HTTP handler thread."""
+
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def on_chunk(self, chunk):
+        self.events.put(("token", chunk))
+
+    def on_finished(self, meta):
+        self.events.put(("done", meta))
+
+    def on_error(self, error):
+        self.events.put(("error", error))
+
+    def on_superseded(self):
+        self.events.put(("error", RuntimeError("Request was superseded")))
+
+
+class CodeBuddyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Streamed lines are small writes; without this, Nagle's algorithm holds each
+        # one back until the client's delayed ACK (~40 ms).
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_text(self, status, text, content_type="text/plain; charset=utf-8"):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_line(self, payload):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, self.server.health())
+        elif self.path == "/stats":
+            self._send_json(200, self.server.stats())
+        elif self.path == "/metrics":
+            self._send_text(200, metrics.prometheus_text(), "text/plain; version=0.0.4; charset=utf-8")
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/api/query":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            missing = [field for field in REQUIRED_FIELDS if not request.get(field)]
+            if missing:
+                raise ValueError(f"Missing fields: {', '.join(missing)}")
+            self.server.console.validate_scenario(request["scenario"])
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        listener = _QueueListener()
+        job = self.server.submit(request, listener)
+        if request.get("stream", True):
+            self._stream(job, listener)
+        else:
+            self._respond(job, listener)
+
+    def _client_gone(self):
+        """True once the client has closed its end. Clients send nothing after the
+        request, so a readable socket with no data to peek means EOF."""
+        try:
+            readable, _, _ = select.select([self.connection], [], [], 0)
+            return bool(readable) and self.connection.recv(1, socket.MSG_PEEK) == b""
+        except (OSError, ValueError):
+            return True
+
+    def _next_event(self, job, listener):
+        """Waits for the job's next event while watching the connection, so a job that
+        is queued or still waiting for its first token doesn't keep its worker slot
+        after the client has left. Returns None, having detached from the job, if it has."""
+        while True:
+            try:
+                return listener.events.get(timeout=DISCONNECT_POLL_INTERVAL)
+            except queue.Empty:
+                if self._client_gone():
+                    self.server.scheduler.detach(job, listener)
+                    self.close_connection = True
+                    return None
+
+    def _stream(self, job, listener):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            while True:
+                event = self._next_event(job, listener)
+                if event is None:
+                    return
+                kind, value = event
+                if kind == "token":
+                    self._write_line({"token": value})
+                    continue
+                if kind == "done":
+                    self._write_line({"done": True, "meta": value})
+                else:
+                    self._write_line({"error": str(value)})
+                break
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away: stop generating, unless another client shares the job.
+            self.server.scheduler.detach(job, listener)
+            self.close_connection = True
+
+    def _respond(self, job, listener):
+        parts = []
+        while True:
+            event = self._next_event(job, listener)
+            if event is None:
+                return
+            kind, value = event
+            if kind == "token":
+                parts.append(value)
+            elif kind == "done":
+                self._send_json(200, {"response": "".join(parts), "meta": value})
+                return
+            else:
+                self._send_json(500, {"error": str(value)})
+                return
+
+
+class CodeBuddyServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, console=None, max_workers=DEFAULT_MAX_WORKERS):
+        super().__init__((host, port), CodeBuddyHandler)
+        self.console = console or CodeBuddyConsole()
+        self.backend = AsyncConsoleBridge(AsyncCodeBuddyConsole(self.console))
+        self.scheduler = RequestScheduler(max_workers)
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self._next_lane = 0
+
+    def handle_error(self, request, client_address):
+        pass
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def submit(self, request, listener):
+        with self._lock:
+            self.requests += 1
+            self._next_lane += 1
+            # Clients supersede their own requests; the server only bounds and dedupes.
+            lane = self._next_lane
+        language, code = request["language"], request.get("code", "")
+        query, scenario, session_id = request["query"], request["scenario"], request["session_id"]
+
+        def stream(meta, cancel):
+            return self.backend.process_query_stream(
+                language, code, query, scenario, session_id, meta=meta, cancel=cancel
+            )
+
+        key = (session_id, scenario, language, code, query)
+        return self.scheduler.submit(key, lane, stream, listener)
+
+    def health(self):
+        return {
+            'status': "ok",
+            'llm_model': self.console.llm_client.model,
+            'embedding_model_loaded': registry.is_loaded(),
+            'uptime': time.time() - self.started_at,
+        }
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'scheduler': self.scheduler.stats(),
+            'llm': self.console.llm_client.stats(),
+            'retrieval_cache': self.console.retrieval_cache.stats(),
+            'response_cache': self.console.response_cache.stats(),
+        }
+
+    def warmup(self):
+        warmup_embedding_model()
+        self.console.llm_client.warmup()
+
+    def close(self):
+        self.scheduler.close(wait=False)
+        self.backend.close()
+        self.console.close()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve CodeBuddy over a local HTTP/JSON API.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="concurrent generations (match OLLAMA_NUM_PARALLEL)")
+    args = parser.parse_args()
+
+    server = CodeBuddyServer(args.host, args.port, max_workers=args.workers)
+    server.warmup()
+    print(f"CodeBuddy listening on {server.url} (set CODEBUDDY_SERVER_URL in the IDE to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -0,0 +1,68 @@
+import time
+import threading
+
+# Cold-start tracking. ui.py imports this first, so STARTED_AT is as close to
+# process start as Python code gets.
+STARTED_AT = time.perf_counter()
+
+
+def since_start():
+    return time.perf_counter() - STARTED_AT
+
+
+class BackgroundLoader:
+    """Builds an expensive object (the AI backend) on a background thread.
+
+    `start()` begins loading; `get()` waits for it, starting it first if needed.
+    Attribute access is forwarded to the loaded object, so callers on worker
+    threads can use the loader in its place and simply wait if it isn't ready."""
+
+    def __init__(self, factory, name="loader"):
+        self._factory = factory
+        self._name = name
+        self._value = None
+        self._error = None
+        self._ready = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+        self.load_seconds = None
+        self.ready_at = None
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._load, name=f"load-{self._name}", daemon=True).start()
+
+    def _load(self):
+        started_at = time.perf_counter()
+        try:
+            self._value = self._factory()
+        except Exception as e:
+            self._error = e
+            print(f"⚠️ Loading {self._name} failed: {e}")
+        finally:
+            self.load_seconds = time.perf_counter() - started_at
+            self.ready_at = since_start()
+            self._ready.set()
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def get(self, timeout=None):
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"{self._name} is still loading")
+        if self._error is not None:
+            raise RuntimeError(f"{self._name} failed to load: {self._error}") from self._error
+        return self._value
+
+    def get_if_ready(self):
+        """The loaded object, or None if it is still loading or failed."""
+        return self._value if self._ready.is_set() else None
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
@@ -0,0 +1,66 @@
+import os
+import sys
+import zlib
+import numpy as np
+import pytest
+
+# The modules live at the repo root, not in a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.fake_ollama import FakeOllamaServer
+from embedding_model import DEFAULT_MODEL_NAME, register_model
+
+EMBEDDING_DIM = 16
+
+
+class TinyEmbedder:
+    """Deterministic stand-in for the sentence-transformer, so tests don't load torch."""
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        vectors = np.stack([
+            np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(EMBEDDING_DIM)
+            for text in texts
+        ]).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def get_sentence_embedding_dimension(self):
+        return EMBEDDING_DIM
+
+
+@pytest.fixture
+def fake_ollama():
+    server = FakeOllamaServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def slow_ollama():
+    """Streams a token every 50 ms, so requests can be cancelled mid-stream."""
+    server = FakeOllamaServer(token_delay=0.05).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_console(tmp_path):
+    """Builds a CodeBuddyConsole on temporary databases, talking to the given fake server."""
+    from main import CodeBuddyConsole
+    from llm_client import OllamaClient
+
+    register_model(DEFAULT_MODEL_NAME, TinyEmbedder())
+    consoles = []
+
+    def make(server):
+        console = CodeBuddyConsole(
+            retrieval_cache_path=str(tmp_path / "retrieval_cache.db"),
+            embeddings_db=str(tmp_path / "embeddings.db"),
+            conversation_db=str(tmp_path / "conversation_history.db"),
+            llm_client=OllamaClient(base_url=server.url),
+        )
+        consoles.append(console)
+        return console
+
+    yield make
+    for console in consoles:
+        console.close()
@@ -0,0 +1,34 @@
+import numpy as np
+from ann_index import DEFAULT_NPROBE, IVFIndex
+from vector_store import normalize_rows
+
+
+def random_rows(count, dim=16, seed=0):
+    return normalize_rows(np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32))
+
+
+def test_calibrated_nprobe_reaches_target_recall(tmp_path):
+    matrix = random_rows(2000)
+    rowids = np.arange(1, len(matrix) + 1)
+    index = IVFIndex.train(matrix, rowids, nlist=64)
+    queries = random_rows(50, seed=1)
+    recall = index.calibrate(matrix, rowids, target_recall=0.9, queries=queries)
+    assert recall >= 0.9
+    assert DEFAULT_NPROBE <= index.nprobe <= index.nlist
+
+    path = str(tmp_path / "index.ivf.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert (loaded.nprobe, loaded.recall) == (index.nprobe, recall)
+    assert IVFIndex.load(path, nprobe=4).nprobe == 4
+
+
+def test_sidecar_without_calibration_uses_default_nprobe(tmp_path):
+    matrix = random_rows(200)
+    index = IVFIndex.train(matrix, np.arange(1, len(matrix) + 1), nlist=16)
+    path = str(tmp_path / "legacy.ivf.npz")
+    with open(path, "wb") as f:
+        np.savez(f, centroids=index.centroids, list_ids=index.list_ids, rowids=index.rowids)
+    loaded = IVFIndex.load(path)
+    assert loaded.nprobe == DEFAULT_NPROBE
+    assert loaded.recall is None
@@ -0,0 +1,21 @@
+import asyncio
+from async_console import AsyncCodeBuddyConsole
+
+
+def test_semantic_cache_counts_one_lookup_per_request(fake_ollama, make_console):
+    console = make_console(fake_ollama)
+    console.response_cache.semantic_threshold = 0.9
+    async_console = AsyncCodeBuddyConsole(console)
+
+    async def ask(query):
+        return "".join([token async for token in async_console.process_query_stream(
+            "c", "int main(void) { return 0; }", query, "General Assistant", "session-1"
+        )])
+
+    first = asyncio.run(ask("Explain this"))
+    assert asyncio.run(ask("Explain this")) == first
+    async_console.close()
+
+    stats = console.response_cache.stats()
+    assert (stats['exact_hits'], stats['semantic_hits'], stats['misses']) == (1, 0, 1)
+    assert stats['hit_rate'] == 0.5
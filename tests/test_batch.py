@@ -0,0 +1,51 @@
+import io
+import json
+import time
+from batch import run_batch
+from main import CodeBuddyConsole
+
+LANGUAGES = ["c", "python", "java", "go"]
+
+
+def test_concurrent_items_keep_their_own_scenario_and_language(fake_ollama, make_console):
+    console = make_console(fake_ollama)
+    scenarios = list(console.scenario_map)
+    items = [
+        {
+            "id": n,
+            "scenario": scenarios[n % len(scenarios)],
+            "language": LANGUAGES[n % len(LANGUAGES)],
+            "code": f"// item {n}",
+            "query": f"request-{n}",
+        }
+        for n in range(40)
+    ]
+
+    # A slow history formatter widens the window in which concurrent requests
+    # could overwrite each other's prompt variables.
+    format_history = console.history_manager.format
+
+    def slow_format(*args):
+        time.sleep(0.005)
+        return format_history(*args)
+
+    console.history_manager.format = slow_format
+    output = io.StringIO()
+    summary = run_batch(console, items, output, concurrency=8)
+
+    assert summary['items'] == len(items)
+    assert summary['errors'] == 0
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert sorted(result["id"] for result in results) == list(range(len(items)))
+
+    prompts = {}
+    for prompt in fake_ollama.prompts:
+        n = int(prompt.split("ADDITIONAL CONTEXT FROM USER: request-")[1].split()[0])
+        prompts[n] = prompt
+    assert len(prompts) == len(items)
+    for item in items:
+        prompt = prompts[item["id"]]
+        scenario_context = console.scenario_map[item["scenario"]]
+        assert f'mode to "{item["scenario"]}"' in prompt
+        assert f'SCENARIO CONTEXT: {scenario_context}' in prompt
+        assert f'specializing in the "{item["language"]}" programming language' in prompt
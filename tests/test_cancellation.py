@@ -0,0 +1,105 @@
+import time
+import asyncio
+import pytest
+from async_console import AsyncCodeBuddyConsole
+from cancellation import CANCELLED, TIMED_OUT, CancelToken
+from llm_client import GenerationCancelled, OllamaClient
+from util.fake_ollama import DEFAULT_RESPONSE
+
+
+def test_cancel_mid_stream_raises(slow_ollama):
+    client = OllamaClient(base_url=slow_ollama.url)
+    cancel = CancelToken()
+    received = []
+    with pytest.raises(GenerationCancelled) as error:
+        for token in client.stream_generate("hello", cancel=cancel):
+            received.append(token)
+            if len(received) == 3:
+                cancel.cancel()
+    assert error.value.reason == CANCELLED
+    assert len(received) == 3
+    client.close()
+
+
+def test_timeout_fires_near_deadline(slow_ollama):
+    client = OllamaClient(base_url=slow_ollama.url)
+    cancel = CancelToken()
+    cancel.set_timeout(0.2)
+    received = []
+    started_at = time.perf_counter()
+    with pytest.raises(GenerationCancelled) as error:
+        for token in client.stream_generate("hello", cancel=cancel):
+            received.append(token)
+    elapsed = time.perf_counter() - started_at
+    assert error.value.reason == TIMED_OUT
+    assert 0.2 <= elapsed < 0.6
+    assert 0 < len(received) < len(slow_ollama.tokens_for("hello"))
+    client.close()
+
+
+def test_aborted_connection_is_not_pooled(slow_ollama):
+    client = OllamaClient(base_url=slow_ollama.url)
+    cancel = CancelToken()
+    with pytest.raises(GenerationCancelled):
+        for _ in client.stream_generate("hello", cancel=cancel):
+            cancel.cancel()
+    assert client._idle.qsize() == 0
+
+    assert client.generate("hello") == DEFAULT_RESPONSE
+    assert client.stats()['connections_opened'] == 2
+    client.close()
+
+
+def test_cancelled_before_request_sends_nothing(slow_ollama):
+    client = OllamaClient(base_url=slow_ollama.url)
+    cancel = CancelToken()
+    cancel.cancel()
+    with pytest.raises(GenerationCancelled):
+        client.generate("hello", cancel=cancel)
+    assert slow_ollama.request_count == 0
+
+
+def test_process_query_stream_saves_partial_answer(slow_ollama, make_console):
+    console = make_console(slow_ollama)
+    cancel = CancelToken()
+    meta = {}
+    received = []
+    for token in console.process_query_stream(
+        "c", "int main(void) { return 0; }", "Explain this", "General Assistant", "session-1",
+        meta=meta, cancel=cancel
+    ):
+        received.append(token)
+        if len(received) == 2:
+            cancel.cancel()
+
+    assert meta['cancelled'] == CANCELLED
+    partial = "".join(received)
+    assert 0 < len(partial) < len(DEFAULT_RESPONSE)
+    assert console.get_conversation_history("session-1") == [("Explain this", partial)]
+    # A cancelled answer is never served from the response cache.
+    assert console.response_cache.stats()['entries'] == 0
+
+
+def test_closing_the_stream_early_saves_partial_answer(slow_ollama, make_console):
+    console = make_console(slow_ollama)
+    stream = console.process_query_stream("c", "", "Explain pointers", "General Assistant", "session-2")
+    partial = next(stream) + next(stream)
+    stream.close()
+
+    assert console.get_conversation_history("session-2") == [("Explain pointers", partial)]
+    assert console.response_cache.stats()['entries'] == 0
+
+
+def test_closing_the_async_stream_early_saves_partial_answer(slow_ollama, make_console):
+    console = make_console(slow_ollama)
+    async_console = AsyncCodeBuddyConsole(console)
+
+    async def read_two_tokens():
+        stream = async_console.process_query_stream("c", "", "Explain arrays", "General Assistant", "session-3")
+        partial = await stream.__anext__() + await stream.__anext__()
+        await stream.aclose()
+        return partial
+
+    partial = asyncio.run(read_two_tokens())
+    async_console.close()
+    assert console.get_conversation_history("session-3") == [("Explain arrays", partial)]
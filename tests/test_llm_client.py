@@ -0,0 +1,54 @@
+import pytest
+from llm_client import OllamaClient, OllamaError
+from util.fake_ollama import DEFAULT_RESPONSE
+
+
+def test_stream_yields_tokens_in_order(fake_ollama):
+    client = OllamaClient(base_url=fake_ollama.url)
+    tokens = list(client.stream_generate("hello"))
+    assert tokens == fake_ollama.tokens_for("hello")
+    assert "".join(tokens) == DEFAULT_RESPONSE
+    client.close()
+
+
+def test_stream_stops_at_done_and_returns_connection_to_pool(fake_ollama):
+    client = OllamaClient(base_url=fake_ollama.url)
+    stream = client.stream_generate("hello")
+    tokens = list(stream)
+    # The final {"done": true} line carries no text and ends the stream.
+    assert tokens[-1] != ""
+    assert client._idle.qsize() == 1
+    client.close()
+
+
+def test_generate_reassembles_response(fake_ollama):
+    client = OllamaClient(base_url=fake_ollama.url)
+    assert client.generate("hello") == DEFAULT_RESPONSE
+    client.close()
+
+
+def test_keep_alive_connection_is_reused(fake_ollama):
+    client = OllamaClient(base_url=fake_ollama.url)
+    for _ in range(3):
+        assert client.generate("hello") == DEFAULT_RESPONSE
+    stats = client.stats()
+    assert stats['requests'] == 3
+    assert stats['connections_opened'] == 1
+    assert fake_ollama.request_count == 3
+    client.close()
+
+
+def test_non_200_response_raises(fake_ollama):
+    client = OllamaClient(model="missing-model", base_url=fake_ollama.url)
+    with pytest.raises(OllamaError, match="HTTP 404.*missing-model"):
+        list(client.stream_generate("hello"))
+    # The failed connection is not pooled; the next good request works.
+    client.model = fake_ollama.model_name
+    assert client.generate("hello") == DEFAULT_RESPONSE
+    client.close()
+
+
+def test_unreachable_server_raises():
+    client = OllamaClient(base_url="http://127.0.0.1:9", timeout=2)
+    with pytest.raises(OSError):
+        client.generate("hello")
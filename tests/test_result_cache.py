@@ -0,0 +1,39 @@
+import sqlite3
+from result_cache import RetrievalCache
+
+RESULTS = [("doc", 0, 0, "A chunk about pointers.", 0.9)]
+
+
+def test_databases_sharing_a_disk_cache_stay_apart(tmp_path):
+    disk_path = str(tmp_path / "retrieval_cache.db")
+    first, second = RetrievalCache(disk_path=disk_path), RetrievalCache(disk_path=disk_path)
+    first_key = first.key(str(tmp_path / "first.db"), "What is a pointer?", 3, "hybrid", "model", 0)
+    second_key = second.key(str(tmp_path / "second.db"), "What is a pointer?", 3, "hybrid", "model", 0)
+
+    first.put(first_key, RESULTS)
+    assert second.get(second_key) is None
+    # A newer version of the second database must not purge the first one's entries.
+    second.put(second.key(str(tmp_path / "second.db"), "What is a pointer?", 3, "hybrid", "model", 1), [])
+    first.close()
+    second.close()
+    reopened = RetrievalCache(disk_path=disk_path)
+    assert reopened.get(first_key) == RESULTS
+    assert reopened.stats()['disk_hits'] == 1
+    reopened.close()
+
+
+def test_legacy_disk_cache_is_dropped(tmp_path):
+    disk_path = str(tmp_path / "retrieval_cache.db")
+    conn = sqlite3.connect(disk_path)
+    conn.execute("CREATE TABLE retrieval_cache (cache_key TEXT PRIMARY KEY, corpus_version INTEGER, "
+                 "results TEXT, last_used REAL)")
+    conn.execute("INSERT INTO retrieval_cache VALUES ('[\"q\", 3, \"hybrid\", \"model\", 0]', 0, '[]', 0)")
+    conn.commit()
+    conn.close()
+
+    cache = RetrievalCache(disk_path=disk_path)
+    assert cache.stats()['disk_entries'] == 0
+    key = cache.key(str(tmp_path / "embeddings.db"), "q", 3, "hybrid", "model", 0)
+    cache.put(key, RESULTS)
+    assert cache.get(key) == RESULTS
+    cache.close()
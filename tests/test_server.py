@@ -0,0 +1,106 @@
+import json
+import time
+import socket
+import threading
+import http.client
+import pytest
+from server import CodeBuddyServer
+from util.fake_ollama import FakeOllamaServer
+
+
+@pytest.fixture
+def make_server(make_console):
+    servers = []
+
+    def make(ollama):
+        server = CodeBuddyServer(port=0, console=make_console(ollama), max_workers=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        # The console is closed by make_console.
+        server.shutdown()
+        server.scheduler.close(wait=False)
+        server.backend.close()
+        server.server_close()
+
+
+def query(text, session_id):
+    return json.dumps({
+        "language": "python", "code": "print(1)", "query": text,
+        "scenario": "Code Correction", "session_id": session_id,
+    }).encode("utf-8")
+
+
+def post_and_hang_up(server, body, after):
+    """Sends a query on a raw socket and closes it `after` seconds later, unread."""
+    host, port = server.server_address[:2]
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(
+            b"POST /api/query HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii") + body
+        )
+        time.sleep(after)
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_queued_job_is_cancelled_when_its_client_disconnects(slow_ollama, make_server):
+    server = make_server(slow_ollama)
+    host, port = server.server_address[:2]
+    first = http.client.HTTPConnection(host, port)
+    first.request("POST", "/api/query", body=query("Why does it fail?", "a"))
+    first_response = first.getresponse()
+    assert wait_for(lambda: server.scheduler.stats()['running'] == 1, 5)
+
+    # The only worker is busy, so this one waits in the queue until its client leaves.
+    post_and_hang_up(server, query("What does it print?", "b"), after=0.1)
+    assert wait_for(lambda: server.scheduler.stats()['queued'] == 0, 1)
+    assert server.scheduler.stats()['running'] == 1
+
+    lines = [json.loads(line) for line in first_response.read().splitlines()]
+    assert lines[-1].get("done")
+    first.close()
+    assert wait_for(lambda: server.scheduler.stats()['in_flight'] == 0, 2)
+    assert slow_ollama.request_count == 1
+
+
+def test_running_job_is_cancelled_before_its_first_token(make_server):
+    ollama = FakeOllamaServer(first_token_delay=2).start()
+    try:
+        server = make_server(ollama)
+        post_and_hang_up(server, query("Why does it fail?", "a"), after=0.3)
+        assert server.scheduler.stats()['running'] == 1
+        assert wait_for(lambda: server.scheduler.stats()['running'] == 0, 1)
+    finally:
+        ollama.stop()
+
+
+def test_shared_job_keeps_running_when_one_client_disconnects(slow_ollama, make_server):
+    server = make_server(slow_ollama)
+    host, port = server.server_address[:2]
+    body = query("Why does it fail?", "a")
+    first = http.client.HTTPConnection(host, port)
+    first.request("POST", "/api/query", body=body)
+    first_response = first.getresponse()
+    assert wait_for(lambda: server.scheduler.stats()['running'] == 1, 5)
+
+    # The same request joins the running job; its client leaving must not end it.
+    post_and_hang_up(server, body, after=0.6)
+    assert server.scheduler.stats()['coalesced'] == 1
+
+    lines = [json.loads(line) for line in first_response.read().splitlines()]
+    first.close()
+    assert lines[-1].get("done")
+    assert "cancelled" not in lines[-1]["meta"]
+    assert "".join(line.get("token", "") for line in lines) == "".join(slow_ollama.tokens_for(slow_ollama.prompts[0]))
+    assert slow_ollama.request_count == 1
@@ -0,0 +1,27 @@
+import time
+import pytest
+
+pytest.importorskip("PyQt6")
+from PyQt6.QtCore import QCoreApplication
+from worker import AIRequest, COALESCE_INTERVAL
+
+
+def test_pending_tokens_are_flushed_without_a_later_token():
+    # Signals emitted on the flush timer's thread are delivered through the event loop.
+    app = QCoreApplication.instance() or QCoreApplication([])
+    request = AIRequest(None, "c", "", "Explain this", "General Assistant", "session-1")
+    received = []
+    request.result_signal.connect(received.append)
+
+    # Within the coalescing window of the last emit, so these are held back...
+    request.on_chunk("Hello")
+    request.on_chunk(", world")
+    assert received == []
+    # ...but only until the window ends, even though generation has paused.
+    time.sleep(COALESCE_INTERVAL * 4)
+    app.processEvents()
+    assert received == ["Hello, world"]
+
+    request.on_finished({})
+    app.processEvents()
+    assert received == ["Hello, world"]
@@ -1,9 +1,30 @@
+from startup import since_start
 import sys
+import json
 from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
 from ide import IDE
 
+
+def measure_startup(app, ide):
+    """--measure-startup: once the AI backend has loaded, prints the startup times
+    (seconds since launch) as JSON and quits."""
+    backend = ide.assistant_backend
+    if ide.window_shown_after is None or (hasattr(backend, "is_ready") and not backend.is_ready()):
+        QTimer.singleShot(50, lambda: measure_startup(app, ide))
+        return
+    print(json.dumps({
+        'window_shown': ide.window_shown_after,
+        'assistant_ready': getattr(backend, "ready_at", None),
+        'assistant_load': getattr(backend, "load_seconds", None),
+    }))
+    app.quit()
+
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     ide = IDE()
     ide.show()
-    sys.exit(app.exec())
\ No newline at end of file
+    if "--measure-startup" in sys.argv:
+        measure_startup(app, ide)
+    sys.exit(app.exec())
@@ -0,0 +1,449 @@
+import os
+import sys
+import json
+import time
+import zlib
+import asyncio
+import sqlite3
+import argparse
+import platform
+import subprocess
+import numpy as np
+from embedding_model import DEFAULT_MODEL_NAME, register_model, embed_query
+from vector_store import content_hash, bump_corpus_version, create_meta_table, get_meta, set_meta
+from lexical_index import fts_table_exists, index_chunks
+from ann_index import IVFIndex, build_sidecar, sidecar_path
+from retrieval import get_index
+from ingest import create_db, embed_pdf
+from database import ConversationStore
+from history import HistoryManager, DEFAULT_MAX_RECENT_TURNS
+from llm_client import OllamaClient
+from main import CodeBuddyConsole
+from async_console import AsyncCodeBuddyConsole
+from batch import percentile
+from util.fake_ollama import FakeOllamaServer
+
+# End-to-end benchmarks on synthetic data, run from the repo root:
+#
+#   python -m util.benchmark --sizes 10k,100k,1M --output bench.json
+#   python -m util.benchmark --sizes 10k --compare bench.json
+#
+# Corpora are generated once per size in --workdir and reused by later runs.
+# Embeddings come from HashingEmbedder (pass --real-embeddings to load the
+# sentence-transformer) and the LLM is util/fake_ollama, so numbers measure
+# CodeBuddy's own overhead and are comparable run over run. Results are JSON;
+# --compare flags p50/p95 latencies, throughputs and ANN recall that got worse.
+
+DEFAULT_SIZES = "10k,100k,1M"
+DEFAULT_WORKDIR = "bench_data"
+DEFAULT_QUERIES = 50
+DEFAULT_MAX_REGRESSION = 0.10
+EMBEDDING_DIM = 384
+VOCABULARY_SIZE = 5000
+WORDS_PER_CHUNK = 60
+BUILD_BATCH = 2000
+TURNS_PER_SESSION = 20
+CODE_SAMPLE = "int main(void) {\n    int values[4] = {3, 1, 2, 4};\n    return values[0];\n}\n"
+
+# Real terms at the head of the vocabulary, so generated text and queries read
+# roughly like the C book the real corpus is built from.
+C_TERMS = (
+    "pointer array struct function variable memory malloc free loop while for if else return "
+    "int char float double void const static extern header include define macro preprocessor "
+    "string buffer overflow stack heap address dereference compile linker error warning printf "
+    "scanf file stream union enum typedef recursion argument parameter scope"
+).split()
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+
+def vocabulary(size=VOCABULARY_SIZE):
+    return C_TERMS + [f"term{i}" for i in range(size - len(C_TERMS))]
+
+
+class HashingEmbedder:
+    """Deterministic stand-in for the sentence-transformer. Every word has a fixed
+    random vector and a text embeds to the normalized sum of its words' vectors,
+    so texts that share words come out similar. Unknown words hash into the
+    vocabulary."""
+
+    def __init__(self, dim=EMBEDDING_DIM, vocabulary_size=VOCABULARY_SIZE, seed=0):
+        rng = np.random.default_rng(seed)
+        self.word_vectors = rng.standard_normal((vocabulary_size, dim)).astype(np.float32)
+        self.words = vocabulary(vocabulary_size)
+        self.word_index = {word: i for i, word in enumerate(self.words)}
+
+    def word_ids(self, text):
+        return [
+            self.word_index.get(word, zlib.crc32(word.encode("utf-8")) % len(self.words))
+            for word in text.lower().split()
+        ] or [0]
+
+    def embed_ids(self, id_matrix):
+        vectors = self.word_vectors[id_matrix].sum(axis=1)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        return np.stack([self.embed_ids(np.array([self.word_ids(text)]))[0] for text in texts])
+
+    def get_sentence_embedding_dimension(self):
+        return self.word_vectors.shape[1]
+
+
+def word_distribution(size):
+    # Zipf-like, as in natural text: a few words are everywhere, most are rare.
+    weights = 1.0 / np.arange(1, size + 1)
+    return weights / weights.sum()
+
+
+def make_queries(count, seed):
+    rng = np.random.default_rng(seed)
+    words = vocabulary()
+    head = len(C_TERMS)
+    return [
+        " ".join([words[i] for i in rng.choice(head, size=3, replace=False)]
+                 + [words[rng.integers(head, len(words))], f"q{seed}x{n}"])
+        for n in range(count)
+    ]
+
+
+def summarize(samples):
+    """Latency samples in seconds -> summary in milliseconds."""
+    if not samples:
+        return {'n': 0}
+    return {
+        'n': len(samples),
+        'mean_ms': 1000 * sum(samples) / len(samples),
+        'p50_ms': 1000 * percentile(samples, 50),
+        'p95_ms': 1000 * percentile(samples, 95),
+        'max_ms': 1000 * max(samples),
+    }
+
+
+def time_calls(fn, inputs):
+    samples = []
+    for item in inputs:
+        started_at = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - started_at)
+    return summarize(samples)
+
+
+def build_corpus(db_path, size, embedder, seed=0, storage=None):
+    """Writes `size` synthetic chunks through the normal store/FTS code paths.
+    Returns the build time, or None if a matching corpus was already there."""
+    marker = f"{size}:{seed}:{embedder.get_sentence_embedding_dimension()}"
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            create_meta_table(conn)
+            if get_meta(conn, "synthetic_corpus") == marker:
+                return None
+        finally:
+            conn.close()
+        os.remove(db_path)
+        for suffix in (".vectors.f32", ".ivf.npz"):
+            stale = os.path.splitext(db_path)[0] + suffix
+            if os.path.exists(stale):
+                os.remove(stale)
+
+    started_at = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    probabilities = word_distribution(len(embedder.words))
+    conn, store = create_db(db_path, storage)
+    try:
+        for batch_start in range(0, size, BUILD_BATCH):
+            count = min(BUILD_BATCH, size - batch_start)
+            ids = rng.choice(len(embedder.words), size=(count, WORDS_PER_CHUNK), p=probabilities)
+            embeddings = embedder.embed_ids(ids)
+            chunks = [" ".join(embedder.words[i] for i in row) for row in ids]
+            doc_id = f"synthetic-{batch_start // BUILD_BATCH}"
+            rows = [(j, chunks[j], embeddings[j], content_hash(chunks[j])) for j in range(count)]
+            with conn:
+                store.insert(conn, doc_id, rows)
+                if fts_table_exists(conn):
+                    state = store.chunk_state(conn, doc_id)
+                    index_chunks(conn, [(state[j][0], chunks[j]) for j in range(count)])
+                conn.execute(
+                    "INSERT INTO documents (doc_id, source_path, content_hash, chunk_count) VALUES (?, ?, ?, ?)",
+                    (doc_id, "synthetic", content_hash("".join(chunks)), count)
+                )
+            if (batch_start // BUILD_BATCH) % 50 == 49:
+                print(f"  {batch_start + count}/{size} chunks written", file=sys.stderr, flush=True)
+        with conn:
+            bump_corpus_version(conn)
+            set_meta(conn, "synthetic_corpus", marker)
+    finally:
+        conn.close()
+    return time.perf_counter() - started_at
+
+
+def bench_retrieval(console, db_path, queries):
+    index = get_index(db_path)
+    started_at = time.perf_counter()
+    index.reload()
+    results = {'load_seconds': time.perf_counter() - started_at}
+
+    embeddings = [embed_query(query) for query in queries]
+    results['dense_exact'] = time_calls(lambda e: index.search(e, 3, exact=True), embeddings)
+    if os.path.exists(sidecar_path(db_path)):
+        results['dense_ann'] = time_calls(lambda e: index.search(e, 3), embeddings)
+        # Reported with the latency, so a drop in recall can't pass for a speed-up.
+        results['dense_ann']['recall_at_3'] = ann_recall(index, embeddings, 3)
+        results['dense_ann']['nprobe'] = index.nprobe or IVFIndex.load(sidecar_path(db_path)).nprobe
+    results['hybrid'] = time_calls(lambda q: index.hybrid_search(q, embed_query, 3), queries)
+    console.retrieval_cache.clear()
+    results['retrieve_relevant_docs'] = time_calls(console.retrieve_relevant_docs, queries)
+    results['retrieve_relevant_docs_cached'] = time_calls(console.retrieve_relevant_docs, queries)
+    return results
+
+
+def ann_recall(index, embeddings, top_k):
+    """Mean fraction of the exact scan's top_k that the IVF search also returns."""
+    found = 0
+    for embedding in embeddings:
+        expected = set(index.dense_candidates(embedding, top_k, exact=True)[0].tolist())
+        found += len(expected.intersection(index.dense_candidates(embedding, top_k)[0].tolist()))
+    return found / (top_k * len(embeddings)) if embeddings else 0.0
+
+
+def populate_history(conversation_db, rows):
+    """Fills conversations with `rows` turns, TURNS_PER_SESSION per session, and
+    summaries covering all but each session's recent turns."""
+    conn = sqlite3.connect(conversation_db)
+    try:
+        if conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == rows:
+            return None
+        started_at = time.perf_counter()
+        sessions = max(rows // TURNS_PER_SESSION, 1)
+        answer = "Use a pointer to the first element and walk the array. " * 4
+        with conn:
+            conn.execute("DELETE FROM conversations")
+            conn.execute("DELETE FROM conversation_summaries")
+            conn.executemany(
+                "INSERT INTO conversations (session_id, user_query, ai_response) VALUES (?, ?, ?)",
+                ((f"session-{n % sessions}", f"question {n} about pointers", answer) for n in range(rows))
+            )
+            conn.execute(f'''
+                INSERT INTO conversation_summaries (session_id, summary, covered_until_id)
+                SELECT session_id, 'Earlier the user asked about pointers.', MAX(id)
+                FROM (
+                    SELECT session_id, id, ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id DESC) AS age
+                    FROM conversations
+                )
+                WHERE age > {DEFAULT_MAX_RECENT_TURNS}
+                GROUP BY session_id
+            ''')
+        return time.perf_counter() - started_at
+    finally:
+        conn.close()
+
+
+def bench_history(conversation_db, rows, llm_client, samples, seed=0):
+    store = ConversationStore(conversation_db)
+    try:
+        populate_seconds = populate_history(conversation_db, rows)
+        history = HistoryManager(llm_client, store)
+        sessions = max(rows // TURNS_PER_SESSION, 1)
+        rng = np.random.default_rng(seed)
+        picks = [f"session-{n}" for n in rng.integers(0, sessions, size=samples)]
+        return {
+            'rows': rows,
+            'populate_seconds': populate_seconds,
+            'recent_turns': time_calls(lambda s: store.recent_turns(s, DEFAULT_MAX_RECENT_TURNS + 1), picks),
+            'context': time_calls(history.context, picks),
+        }
+    finally:
+        store.close()
+
+
+def bench_pipeline(console, queries):
+    def run_sync(n, query):
+        meta = {}
+        for _ in console.process_query_stream("c", CODE_SAMPLE, query, "General Assistant",
+                                              f"bench-{n % 8}", meta=meta):
+            pass
+        return meta
+
+    def run_async(async_console, loop, n, query):
+        _, meta = loop.run_until_complete(async_console.ask(
+            "c", CODE_SAMPLE, query, "General Assistant", f"bench-async-{n % 8}"
+        ))
+        return meta
+
+    results = {}
+    metas = [run_sync(n, query) for n, query in enumerate(queries)]
+    results['sync_first_token'] = summarize([meta['time_to_first_token'] for meta in metas])
+    results['sync_total'] = summarize([meta['total_time'] for meta in metas])
+
+    async_console = AsyncCodeBuddyConsole(console)
+    loop = asyncio.new_event_loop()
+    try:
+        metas = [run_async(async_console, loop, n, query + " async") for n, query in enumerate(queries)]
+    finally:
+        loop.close()
+        async_console.close()
+    results['async_first_token'] = summarize([meta['time_to_first_token'] for meta in metas])
+    results['async_total'] = summarize([meta['total_time'] for meta in metas])
+    return results
+
+
+def write_pdf(path, pages, seed=0):
+    import pymupdf
+    rng = np.random.default_rng(seed)
+    words = vocabulary()
+    probabilities = word_distribution(len(words))
+    doc = pymupdf.open()
+    for _ in range(pages):
+        ids = rng.choice(len(words), size=(70, 14), p=probabilities)
+        text = "\n".join(" ".join(words[i] for i in line) for line in ids)
+        doc.new_page().insert_text((36, 36), text, fontsize=6)
+    doc.save(path)
+    doc.close()
+
+
+def bench_ingest(workdir, pages, storage=None):
+    pdf_path = os.path.join(workdir, "ingest_bench.pdf")
+    db_path = os.path.join(workdir, "ingest_bench.db")
+    for path in (db_path, os.path.splitext(db_path)[0] + ".vectors.f32"):
+        if os.path.exists(path):
+            os.remove(path)
+    write_pdf(pdf_path, pages)
+
+    started_at = time.perf_counter()
+    chunks = embed_pdf(pdf_path, "ingest-bench", db_path=db_path, storage=storage)
+    elapsed = time.perf_counter() - started_at
+    started_at = time.perf_counter()
+    embed_pdf(pdf_path, "ingest-bench", db_path=db_path, storage=storage)
+    return {
+        'pages': pages,
+        'chunks': chunks,
+        'seconds': elapsed,
+        'chunks_per_sec': chunks / elapsed if elapsed > 0 else 0.0,
+        'unchanged_reingest_seconds': time.perf_counter() - started_at,
+    }
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(baseline, current, max_regression, path=()):
+    """Yields (path, old, new) for latencies that grew, or throughputs and recall
+    that fell, by more than `max_regression` (a fraction)."""
+    for key, new in current.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+        if isinstance(new, dict):
+            yield from compare(old or {}, new, max_regression, path + (key,))
+        elif isinstance(new, (int, float)) and isinstance(old, (int, float)) and old > 0:
+            if key.startswith(("p50", "p95")) and new > old * (1 + max_regression):
+                yield path + (key,), old, new
+            elif (key.endswith("per_sec") or key.startswith("recall")) and new < old * (1 - max_regression):
+                yield path + (key,), old, new
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CodeBuddy on synthetic corpora with a fake LLM.")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="corpus sizes in chunks, e.g. 10k,100k,1M")
+    parser.add_argument("--workdir", default=DEFAULT_WORKDIR, help="where generated corpora are kept")
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="queries per measurement")
+    parser.add_argument("--storage", choices=("sqlite", "memmap"), default=None)
+    parser.add_argument("--no-ann", action="store_true", help="don't build IVF sidecars")
+    parser.add_argument("--skip", default="", help="comma-separated: retrieval,history,pipeline,ingest")
+    parser.add_argument("--ingest-pages", type=int, default=100)
+    parser.add_argument("--token-delay", type=float, default=0.0, help="fake LLM seconds per token")
+    parser.add_argument("--first-token-delay", type=float, default=0.0, help="fake LLM seconds before the first token")
+    parser.add_argument("--real-embeddings", action="store_true", help=f"use {DEFAULT_MODEL_NAME} instead of HashingEmbedder")
+    parser.add_argument("--output", help="write results JSON here (default stdout)")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION)
+    args = parser.parse_args(argv)
+
+    skip = {name.strip() for name in args.skip.split(",") if name.strip()}
+    os.makedirs(args.workdir, exist_ok=True)
+    embedder = HashingEmbedder()
+    if not args.real_embeddings:
+        register_model(DEFAULT_MODEL_NAME, embedder)
+
+    server = FakeOllamaServer(token_delay=args.token_delay, first_token_delay=args.first_token_delay).start()
+    llm_client = OllamaClient(base_url=server.url)
+    results = {'environment': environment(), 'arguments': vars(args), 'corpora': {}}
+    try:
+        for size in [parse_size(size) for size in args.sizes.split(",")]:
+            print(f"Corpus of {size} chunks", file=sys.stderr, flush=True)
+            size_dir = os.path.join(args.workdir, f"corpus_{size}")
+            os.makedirs(size_dir, exist_ok=True)
+            db_path = os.path.join(size_dir, "embeddings.db")
+            entry = results['corpora'][str(size)] = {
+                'build_seconds': build_corpus(db_path, size, embedder, storage=args.storage)
+            }
+            if not args.no_ann and not os.path.exists(sidecar_path(db_path)):
+                started_at = time.perf_counter()
+                # Calibrated on queries like the measured ones, but not the same ones.
+                calibration = [embed_query(query) for query in make_queries(args.queries, seed=size + 2)]
+                build_sidecar(db_path, queries=calibration)
+                entry['ann_build_seconds'] = time.perf_counter() - started_at
+
+            console = CodeBuddyConsole(
+                retrieval_cache_path=None, embeddings_db=db_path,
+                conversation_db=os.path.join(size_dir, "pipeline_history.db"), llm_client=llm_client
+            )
+            try:
+                queries = make_queries(args.queries, seed=size)
+                if "retrieval" not in skip:
+                    entry['retrieval'] = bench_retrieval(console, db_path, queries)
+                if "history" not in skip:
+                    entry['history'] = bench_history(
+                        os.path.join(size_dir, "conversation_history.db"), size, llm_client, args.queries
+                    )
+                if "pipeline" not in skip:
+                    # Fresh queries, so the pipeline doesn't hit the retrieval cache warmed above.
+                    entry['pipeline'] = bench_pipeline(console, make_queries(args.queries, seed=size + 1))
+            finally:
+                console.close()
+
+        if "ingest" not in skip:
+            print("Ingestion", file=sys.stderr, flush=True)
+            results['ingest'] = bench_ingest(args.workdir, args.ingest_pages, args.storage)
+    finally:
+        llm_client.close()
+        server.stop()
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = list(compare(baseline, results, args.max_regression))
+        for path, old, new in regressions:
+            print(f"REGRESSION {'.'.join(path)}: {old:.3f} -> {new:.3f}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.max_regression:.0%} against {args.compare}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+import socket
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for Ollama's HTTP API, for measuring and exercising the streaming
+# path without a GPU or a real model. Responses are deterministic: the same prompt
+# always produces the same tokens.
+
+DEFAULT_RESPONSE = "Here is a deterministic answer from the fake Ollama server. Do you need any further assistance?"
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Streamed lines are small writes; without this, Nagle's algorithm holds each
+        # one back until the client's delayed ACK (~40 ms).
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path in ("/", "/api/tags"):
+            self._send_json(200, {"models": [{"name": self.server.model_name}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        self.server.request_count += 1
+        self.server.prompts.append(request.get("prompt", ""))
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        if request.get("model", self.server.model_name) != self.server.model_name:
+            # What Ollama answers for a model that hasn't been pulled.
+            self._send_json(404, {"error": f"model '{request['model']}' not found, try pulling it first"})
+            return
+
+        time.sleep(self.server.first_token_delay)
+        tokens = self.server.tokens_for(request.get("prompt", ""))
+        if not request.get("stream", True):
+            time.sleep(self.server.token_delay * len(tokens))
+            self._send_json(200, {"model": request.get("model"), "response": "".join(tokens), "done": True})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                message = {"model": request.get("model"), "response": token, "done": False}
+                self._write_chunk(json.dumps(message).encode("utf-8") + b"\n")
+                time.sleep(self.server.token_delay)
+            self._write_chunk(json.dumps({"model": request.get("model"), "response": "", "done": True}).encode("utf-8") + b"\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.aborted_count += 1
+            self.close_connection = True
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, response=DEFAULT_RESPONSE,
+                 token_delay=0.0, first_token_delay=0.0, model_name="qwen2.5-coder:7b"):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.response = response
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.model_name = model_name
+        self.request_count = 0
+        # Every prompt received, in arrival order, for tests to inspect.
+        self.prompts = []
+        self.aborted_count = 0
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        pass
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def tokens_for(self, prompt):
+        words = self.response.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake, deterministic Ollama API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="seconds before the first token")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, token_delay=args.token_delay,
+                              first_token_delay=args.first_token_delay)
+    print(f"Fake Ollama listening on {server.url} (set OLLAMA_HOST to use it)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
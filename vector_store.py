@@ -0,0 +1,434 @@
+import os
+import zlib
+import hashlib
+import sqlite3
+import numpy as np
+from quantization import CODE_DTYPES, FLOAT16, INT8, MODES, NO_QUANTIZATION, quantize
+
+SQLITE_STORAGE = "sqlite"
+MEMMAP_STORAGE = "memmap"
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def create_meta_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+def get_meta(conn, key, default=None):
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    except sqlite3.OperationalError:
+        return default
+    return row[0] if row else default
+
+
+def set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def get_corpus_version(conn):
+    return int(get_meta(conn, "corpus_version", 0))
+
+
+def bump_corpus_version(conn):
+    version = get_corpus_version(conn) + 1
+    set_meta(conn, "corpus_version", version)
+    return version
+
+
+def get_quantization(conn):
+    return get_meta(conn, "quantization", NO_QUANTIZATION)
+
+
+def _table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+class SQLiteVectorStore:
+    """Chunk text and float32 embeddings stored side by side in the embeddings table."""
+
+    kind = SQLITE_STORAGE
+    table = "embeddings"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    def _create_table(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                doc_id TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk TEXT,
+                embedding BLOB,
+                chunk_hash TEXT,
+                embedding_q BLOB,
+                scale REAL,
+                PRIMARY KEY (doc_id, chunk_id)
+            )
+        ''')
+
+    def _migrate_legacy_table(self, conn):
+        """Rebuilds a legacy embeddings table (no key, possibly duplicated by earlier
+        blind re-runs) into the keyed layout, keeping the first copy of each chunk."""
+        with conn:
+            conn.execute("ALTER TABLE embeddings RENAME TO embeddings_legacy")
+            self._create_table(conn)
+            conn.execute('''
+                INSERT OR IGNORE INTO embeddings (doc_id, chunk_id, chunk, embedding)
+                SELECT doc_id, chunk_id, chunk, embedding FROM embeddings_legacy ORDER BY rowid
+            ''')
+            conn.execute("DROP TABLE embeddings_legacy")
+            rows = conn.execute("SELECT rowid, chunk FROM embeddings").fetchall()
+            conn.executemany(
+                "UPDATE embeddings SET chunk_hash = ? WHERE rowid = ?",
+                [(content_hash(chunk), rowid) for rowid, chunk in rows]
+            )
+            bump_corpus_version(conn)
+        conn.execute("VACUUM")
+
+    def create_schema(self, conn):
+        """Creates the table, returning True if a legacy table had to be migrated
+        (which renumbers rowids)."""
+        migrated = False
+        if _table_exists(conn, "embeddings"):
+            columns = conn.execute("PRAGMA table_info(embeddings)").fetchall()
+            if not any(column[5] for column in columns):
+                self._migrate_legacy_table(conn)
+                migrated = True
+            column_names = {column[1] for column in conn.execute("PRAGMA table_info(embeddings)")}
+            for column, column_type in (("embedding_q", "BLOB"), ("scale", "REAL")):
+                if column not in column_names:
+                    conn.execute(f"ALTER TABLE embeddings ADD COLUMN {column} {column_type}")
+        self._create_table(conn)
+        return migrated
+
+    def signature(self, conn):
+        try:
+            return conn.execute("SELECT COUNT(*), MAX(rowid) FROM embeddings").fetchone()
+        except sqlite3.OperationalError:
+            return None
+
+    def read_vectors(self, conn, min_rowid=0):
+        rows = conn.execute(
+            "SELECT rowid, embedding FROM embeddings WHERE rowid > ? ORDER BY rowid", (min_rowid,)
+        ).fetchall()
+        rowids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        if not rows:
+            return rowids, np.empty((0, 0), dtype=np.float32)
+        matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+        return rowids, normalize_rows(matrix.reshape(len(rows), -1).copy())
+
+    def load(self, conn):
+        """Returns (rowids, matrix, positions, scales). `matrix` holds the vectors at
+        the database's quantization; `positions` maps each rowid to its row in
+        `matrix` (None means they line up one to one) and `scales` are the int8
+        per-vector scales."""
+        mode = get_quantization(conn)
+        if mode == NO_QUANTIZATION:
+            rowids, matrix = self.read_vectors(conn)
+            return rowids, matrix, None, None
+
+        rows = conn.execute(
+            "SELECT rowid, embedding_q, scale FROM embeddings ORDER BY rowid"
+        ).fetchall()
+        rowids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        codes = np.frombuffer(b"".join(row[1] for row in rows), dtype=CODE_DTYPES[mode])
+        scales = None
+        if mode == INT8:
+            scales = np.fromiter((row[2] for row in rows), dtype=np.float32, count=len(rows))
+        return rowids, codes.reshape(len(rows), -1), None, scales
+
+    def exact_vectors(self, conn, rowids):
+        """Full-precision unit vectors for `rowids`, in the given order."""
+        placeholders = ",".join("?" * len(rowids))
+        by_rowid = dict(conn.execute(
+            f"SELECT rowid, embedding FROM embeddings WHERE rowid IN ({placeholders})", rowids
+        ).fetchall())
+        matrix = np.frombuffer(b"".join(by_rowid[rowid] for rowid in rowids), dtype=np.float32)
+        return normalize_rows(matrix.reshape(len(rowids), -1).copy())
+
+    def fetch_chunks(self, conn, rowids):
+        placeholders = ",".join("?" * len(rowids))
+        rows = conn.execute(f'''
+            SELECT rowid, doc_id, chunk_id, chunk
+            FROM embeddings
+            WHERE rowid IN ({placeholders})
+        ''', rowids).fetchall()
+        return {row[0]: row[1:] for row in rows}
+
+    def iter_chunks(self, conn, doc_id=None):
+        if doc_id is None:
+            return conn.execute("SELECT rowid, chunk FROM embeddings").fetchall()
+        return conn.execute("SELECT rowid, chunk FROM embeddings WHERE doc_id = ?", (doc_id,)).fetchall()
+
+    def chunk_state(self, conn, doc_id):
+        return {
+            chunk_id: (rowid, chunk_hash)
+            for rowid, chunk_id, chunk_hash in conn.execute(
+                "SELECT rowid, chunk_id, chunk_hash FROM embeddings WHERE doc_id = ?", (doc_id,)
+            )
+        }
+
+    def delete(self, conn, rowids):
+        conn.executemany("DELETE FROM embeddings WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+    def insert(self, conn, doc_id, rows):
+        """`rows` holds (chunk_id, chunk, embedding, chunk_hash) tuples."""
+        if not rows:
+            return
+        embeddings = np.array([row[2] for row in rows], dtype=np.float32)
+        mode = get_quantization(conn)
+        codes, scales = (None, None)
+        if mode != NO_QUANTIZATION:
+            codes, scales = quantize(normalize_rows(embeddings.copy()), mode)
+
+        conn.executemany('''
+            INSERT INTO embeddings (doc_id, chunk_id, chunk, embedding, chunk_hash, embedding_q, scale)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (
+                doc_id, chunk_id, chunk, embeddings[i].tobytes(), chunk_hash,
+                codes[i].tobytes() if codes is not None else None,
+                float(scales[i]) if scales is not None else None
+            )
+            for i, (chunk_id, chunk, _, chunk_hash) in enumerate(rows)
+        ])
+
+    def quantize_all(self, conn, mode, batch_size=4096):
+        """Rewrites the quantized copy of every vector for `mode`; the float32
+        embeddings are kept for rescoring."""
+        last_rowid = 0
+        while True:
+            rows = conn.execute(
+                "SELECT rowid, embedding FROM embeddings WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_rowid = rows[-1][0]
+            if mode == NO_QUANTIZATION:
+                updates = [(None, None, rowid) for rowid, _ in rows]
+            else:
+                matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+                codes, scales = quantize(normalize_rows(matrix.reshape(len(rows), -1).copy()), mode)
+                updates = [
+                    (codes[i].tobytes(), float(scales[i]) if scales is not None else None, rowid)
+                    for i, (rowid, _) in enumerate(rows)
+                ]
+            conn.executemany("UPDATE embeddings SET embedding_q = ?, scale = ? WHERE rowid = ?", updates)
+
+
+class MemmapVectorStore:
+    """Pre-normalized float32 vectors in an append-only raw file next to the database,
+    opened with np.memmap so loading is zero-copy. SQLite keeps only metadata and
+    zlib-compressed chunk text; a chunk's rowid is its 1-based row in the file."""
+
+    kind = MEMMAP_STORAGE
+    table = "chunks"
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.vectors_path = os.path.splitext(db_path)[0] + ".vectors.f32"
+        self.scales_path = os.path.splitext(db_path)[0] + ".scales.f32"
+
+    def codes_path(self, mode):
+        return os.path.splitext(self.db_path)[0] + {FLOAT16: ".vectors.f16", INT8: ".vectors.i8"}[mode]
+
+    def create_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                vec_row INTEGER PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                chunk_id INTEGER NOT NULL,
+                chunk_z BLOB,
+                chunk_hash TEXT,
+                UNIQUE (doc_id, chunk_id)
+            )
+        ''')
+        return False
+
+    def _dim(self, conn):
+        dim = get_meta(conn, "dim")
+        return int(dim) if dim is not None else None
+
+    def _row_count(self, dim):
+        if not dim or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * dim)
+
+    def _memmap(self, path, dtype, shape):
+        if not shape[0]:
+            return np.empty(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def _vectors(self, dim):
+        return self._memmap(self.vectors_path, np.float32, (self._row_count(dim), dim or 0))
+
+    def signature(self, conn):
+        try:
+            return conn.execute("SELECT COUNT(*), MAX(vec_row) FROM chunks").fetchone()
+        except sqlite3.OperationalError:
+            return None
+
+    def _live_rowids(self, conn, min_rowid=0):
+        rows = conn.execute(
+            "SELECT vec_row FROM chunks WHERE vec_row > ? ORDER BY vec_row", (min_rowid,)
+        ).fetchall()
+        return np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+
+    def read_vectors(self, conn, min_rowid=0):
+        rowids = self._live_rowids(conn, min_rowid)
+        if not len(rowids):
+            return rowids, np.empty((0, 0), dtype=np.float32)
+        return rowids, np.asarray(self._vectors(self._dim(conn))[rowids - 1])
+
+    def load(self, conn):
+        rowids = self._live_rowids(conn)
+        dim = self._dim(conn)
+        mode = get_quantization(conn)
+        if mode == NO_QUANTIZATION:
+            return rowids, self._vectors(dim), rowids - 1, None
+
+        n_rows = self._row_count(dim)
+        codes = self._memmap(self.codes_path(mode), CODE_DTYPES[mode], (n_rows, dim or 0))
+        scales = None
+        if mode == INT8:
+            scales = self._memmap(self.scales_path, np.float32, (n_rows,))
+        return rowids, codes, rowids - 1, scales
+
+    def exact_vectors(self, conn, rowids):
+        return np.asarray(self._vectors(self._dim(conn))[np.asarray(rowids, dtype=np.int64) - 1])
+
+    def fetch_chunks(self, conn, rowids):
+        placeholders = ",".join("?" * len(rowids))
+        rows = conn.execute(f'''
+            SELECT vec_row, doc_id, chunk_id, chunk_z
+            FROM chunks
+            WHERE vec_row IN ({placeholders})
+        ''', rowids).fetchall()
+        return {
+            rowid: (doc_id, chunk_id, zlib.decompress(chunk_z).decode("utf-8"))
+            for rowid, doc_id, chunk_id, chunk_z in rows
+        }
+
+    def iter_chunks(self, conn, doc_id=None):
+        if doc_id is None:
+            rows = conn.execute("SELECT vec_row, chunk_z FROM chunks")
+        else:
+            rows = conn.execute("SELECT vec_row, chunk_z FROM chunks WHERE doc_id = ?", (doc_id,))
+        return [(rowid, zlib.decompress(chunk_z).decode("utf-8")) for rowid, chunk_z in rows]
+
+    def chunk_state(self, conn, doc_id):
+        return {
+            chunk_id: (rowid, chunk_hash)
+            for rowid, chunk_id, chunk_hash in conn.execute(
+                "SELECT vec_row, chunk_id, chunk_hash FROM chunks WHERE doc_id = ?", (doc_id,)
+            )
+        }
+
+    def delete(self, conn, rowids):
+        # Vectors stay in the file as dead rows; only the metadata row goes away.
+        conn.executemany("DELETE FROM chunks WHERE vec_row = ?", [(rowid,) for rowid in rowids])
+
+    def insert(self, conn, doc_id, rows):
+        if not rows:
+            return
+        vectors = normalize_rows(np.array([row[2] for row in rows], dtype=np.float32))
+        dim = self._dim(conn)
+        if dim is None:
+            dim = vectors.shape[1]
+            set_meta(conn, "dim", dim)
+        elif dim != vectors.shape[1]:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {dim}")
+
+        # Drop any torn tail from an interrupted append before writing new rows.
+        start_row = self._row_count(dim)
+        self._append(self.vectors_path, start_row * 4 * dim, vectors)
+        mode = get_quantization(conn)
+        if mode != NO_QUANTIZATION:
+            codes, scales = quantize(vectors, mode)
+            self._append(self.codes_path(mode), start_row * codes.itemsize * dim, codes)
+            if scales is not None:
+                self._append(self.scales_path, start_row * 4, scales)
+
+        conn.executemany('''
+            INSERT INTO chunks (vec_row, doc_id, chunk_id, chunk_z, chunk_hash)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (start_row + i + 1, doc_id, chunk_id, zlib.compress(chunk.encode("utf-8")), chunk_hash)
+            for i, (chunk_id, chunk, _, chunk_hash) in enumerate(rows)
+        ])
+
+    def _append(self, path, offset, array):
+        with open(path, "ab") as f:
+            f.truncate(offset)
+            f.write(array.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def quantize_all(self, conn, mode, batch_size=65536):
+        for stale_mode in (FLOAT16, INT8):
+            if stale_mode != mode and os.path.exists(self.codes_path(stale_mode)):
+                os.remove(self.codes_path(stale_mode))
+        if mode != INT8 and os.path.exists(self.scales_path):
+            os.remove(self.scales_path)
+        if mode == NO_QUANTIZATION:
+            return
+
+        vectors = self._vectors(self._dim(conn))
+        codes_tmp, scales_tmp = self.codes_path(mode) + ".tmp", self.scales_path + ".tmp"
+        with open(codes_tmp, "wb") as codes_file, open(scales_tmp, "wb") as scales_file:
+            for start in range(0, len(vectors), batch_size):
+                codes, scales = quantize(vectors[start:start + batch_size], mode)
+                codes_file.write(codes.tobytes())
+                if scales is not None:
+                    scales_file.write(scales.tobytes())
+        os.replace(codes_tmp, self.codes_path(mode))
+        if mode == INT8:
+            os.replace(scales_tmp, self.scales_path)
+        else:
+            os.remove(scales_tmp)
+
+
+def set_quantization(conn, store, mode):
+    """Migrates an existing database to `mode`, (re)building the quantized vectors."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}'. Choose from: {list(MODES)}")
+    with conn:
+        store.quantize_all(conn, mode)
+        set_meta(conn, "quantization", mode)
+        bump_corpus_version(conn)
+
+
+STORES = {
+    SQLITE_STORAGE: SQLiteVectorStore,
+    MEMMAP_STORAGE: MemmapVectorStore,
+}
+
+
+def open_store(conn, db_path, storage=None):
+    """Returns the store recorded for this database. `storage` picks the backend
+    for a database that has not recorded one yet."""
+    recorded = get_meta(conn, "storage")
+    if recorded is None:
+        recorded = storage or SQLITE_STORAGE
+    elif storage and storage != recorded:
+        raise ValueError(f"'{db_path}' uses {recorded} storage, not {storage}")
+    return STORES[recorded](db_path)
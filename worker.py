@@ -1,8 +1,24 @@
-from PyQt6.QtCore import QThread, pyqtSignal
+import time
+import hashlib
+import threading
+from PyQt6.QtCore import QObject, pyqtSignal
+from metrics import metrics
+
+# Tokens are forwarded to the UI in batches so a fast stream doesn't flood the
+# event loop with one signal per token. A batch is sent at most COALESCE_INTERVAL
+# after its first token, whether or not more tokens follow.
+COALESCE_INTERVAL = 0.05
+COALESCE_MAX_CHARS = 256
+
+class AIRequest(QObject):
+    """An Assist request as seen by the UI. It is run by a RequestScheduler and
+    receives the job's callbacks on a worker thread; Qt delivers the signals to
+    the GUI thread."""
 
-class AIWorker(QThread):
     result_signal = pyqtSignal(str)
+    finished_signal = pyqtSignal(dict)
     error_signal = pyqtSignal(str)
+    superseded_signal = pyqtSignal()
 
     def __init__(self, code_buddy, language, code, prompt, assistant, session_id):
         super().__init__()
@@ -11,15 +27,74 @@ class AIWorker(QThread):
         self.code = code
         self.prompt = prompt
         self.assistant = assistant
-        self.session_id = session_id  
-
-    def run(self):
-        try:
-            for chunk in self.code_buddy.process_query_stream(
-                self.language, self.code, self.prompt, self.assistant, self.session_id
-            ):
-                self.result_signal.emit(chunk)
-        except ValueError as e:
-            self.error_signal.emit(f"⚠️ Error: {str(e)}")
-        except Exception as e:
-            self.error_signal.emit(f"⚠️ An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        self.session_id = session_id
+        self.job = None
+        self.submitted_at = None
+        self.queue_wait = None
+        self._pending = []
+        self._pending_chars = 0
+        self._last_emit = time.perf_counter()
+        self._flush_timer = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        code_hash = hashlib.sha256(self.code.encode("utf-8")).hexdigest()
+        return (self.session_id, self.assistant, self.language, code_hash, self.prompt)
+
+    def stream(self, meta, cancel):
+        # Called when a scheduler worker picks the job up.
+        self.queue_wait = time.perf_counter() - self.submitted_at
+        metrics.observe("assist", "queue_wait", self.queue_wait)
+        return self.code_buddy.process_query_stream(
+            self.language, self.code, self.prompt, self.assistant, self.session_id, meta=meta, cancel=cancel
+        )
+
+    def submit(self, scheduler):
+        self.submitted_at = time.perf_counter()
+        self.job = scheduler.submit(self.key, self.session_id, self.stream, self)
+        return self.job
+
+    def _flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._pending:
+            self.result_signal.emit("".join(self._pending))
+            self._pending, self._pending_chars = [], 0
+        self._last_emit = time.perf_counter()
+
+    def on_chunk(self, chunk):
+        with self._lock:
+            self._pending.append(chunk)
+            self._pending_chars += len(chunk)
+            since_emit = time.perf_counter() - self._last_emit
+            if self._pending_chars >= COALESCE_MAX_CHARS or since_emit >= COALESCE_INTERVAL:
+                self._flush()
+            elif self._flush_timer is None:
+                # Generation may pause here; don't hold these back until the next token.
+                self._flush_timer = threading.Timer(COALESCE_INTERVAL - since_emit, self._flush_due)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def _flush_due(self):
+        with self._lock:
+            self._flush()
+
+    def on_finished(self, meta):
+        with self._lock:
+            self._flush()
+        if self.queue_wait is not None:
+            meta = dict(meta, timings={'queue_wait': self.queue_wait, **meta.get('timings', {})})
+        self.finished_signal.emit(meta)
+
+    def on_error(self, error):
+        with self._lock:
+            self._flush()
+        if isinstance(error, ValueError):
+            self.error_signal.emit(f"⚠️ Error: {str(error)}")
+        else:
+            self.error_signal.emit(f"⚠️ An unexpected error occurred: {str(error)}")
+
+    def on_superseded(self):
+        self.superseded_signal.emit()